@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+import argparse
+import datetime as dt
+import time
+import fre_pp_interface as pp
+
+
+#-- simple argument parser
+parser = argparse.ArgumentParser()
+parser.add_argument(
+            "-n",
+            "--nfiles",
+            type=int,
+            nargs="+",
+            default=[10000, 100000, 1000000, 2000000],
+            help="number of filenames to assemble",
+        )
+parser.add_argument(
+            "--legacy-max",
+            type=int,
+            default=100000,
+            help="largest size to also run the per-slice legacy algorithm on",
+        )
+
+args = parser.parse_args()
+
+
+def fake_listfiles(nfiles, slices=(20, 10, 5, 1)):
+    """ build nfiles daily filenames for one field, spread over several
+    time slices and as many ensemble members as needed """
+    listfiles = []
+    member = 0
+    while len(listfiles) < nfiles:
+        for k, nyr in enumerate(slices):
+            # longer slices only cover the beginning of the run
+            for year in range(1000, 1000 + 1000 * (k + 1), nyr):
+                cdates = f"{year:04d}0101-{year + nyr - 1:04d}1231"
+                listfiles.append(f"/archive/member{member:04d}/pp/ocean_daily/ts/daily/"
+                                 f"{nyr}yr/ocean_daily.{cdates}.tos.nc")
+        member += 1
+    return listfiles[:nfiles]
+
+
+def legacy_build_mixed_slices_listfiles(listfiles):
+    """ the original algorithm, one full scan per time slice """
+    slices = pp.available_timeslices(listfiles)
+    ordered_slices = pp.order_timeslices(slices)
+    merged_list = []
+    last = dt.datetime(1, 1, 1)
+    for tslice in ordered_slices:
+        tmplist = pp.filter_by_slice_and_order_chrono(listfiles, tslice)
+        for f in tmplist:
+            fname = f.replace('/', ' ').split()[-1]
+            start, end = pp.get_dates_from_filename(fname)
+            if start > last:
+                merged_list.append(f)
+                last = end
+    return merged_list
+
+
+for nfiles in args.nfiles:
+    listfiles = fake_listfiles(nfiles)
+
+    tic = time.perf_counter()
+    merged = pp.build_mixed_slices_listfiles(listfiles)
+    elapsed = time.perf_counter() - tic
+    print(f"{nfiles:>9d} files: {elapsed:8.3f}s "
+          f"({1e6 * elapsed / nfiles:.2f} us/file), {len(merged)} selected")
+
+    if nfiles <= args.legacy_max:
+        tic = time.perf_counter()
+        legacy = legacy_build_mixed_slices_listfiles(listfiles)
+        elapsed_legacy = time.perf_counter() - tic
+        assert legacy == merged, "results differ from legacy algorithm"
+        print(f"{'':>9s}  legacy {elapsed_legacy:8.3f}s "
+              f"(speedup {elapsed_legacy / elapsed:.1f}x)")
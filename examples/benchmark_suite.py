@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+import argparse
+import shutil
+import tempfile
+import time
+import fre_pp_interface as pp
+
+
+#-- simple argument parser
+parser = argparse.ArgumentParser()
+parser.add_argument(
+            "-s",
+            "--scales",
+            type=str,
+            nargs="+",
+            default=["small", "medium"],
+            choices=["small", "medium", "large"],
+            help="sizes of the synthetic archive to benchmark",
+        )
+parser.add_argument(
+            "-w",
+            "--workdir",
+            type=str,
+            required=False,
+            help="directory for synthetic archives and outputs (default: temporary)",
+        )
+parser.add_argument(
+            "-k",
+            "--keep",
+            action="store_true",
+            help="keep synthetic archives and outputs",
+        )
+
+args = parser.parse_args()
+
+# synthetic archive for each scale: cycles, years per cycle, time slices,
+# grid size and output file length
+SCALES = {'small': dict(ncycles=3, nyears=12, slices=(5, 1), nx=8, ny=6,
+                        nyears_file=5),
+          'medium': dict(ncycles=4, nyears=30, slices=(10, 5, 1), nx=90, ny=60,
+                         nyears_file=10),
+          'large': dict(ncycles=6, nyears=60, slices=(20, 10, 5, 1), nx=360,
+                        ny=210, nyears_file=20)}
+
+stream = 'ocean_monthly'
+var = 'tos'
+
+
+def timed(label, func, *fargs, **kwargs):
+    """ run func and print elapsed time """
+    tic = time.perf_counter()
+    out = func(*fargs, **kwargs)
+    print(f"  {label:<32s} {time.perf_counter() - tic:8.3f}s")
+    return out
+
+
+workdir = args.workdir if args.workdir is not None else tempfile.mkdtemp()
+
+for scale in args.scales:
+    conf = SCALES[scale]
+    rootdir = f"{workdir}/{scale}"
+    nyears_cycles = [conf['nyears']] * conf['ncycles']
+    gaps = [0] * (conf['ncycles'] - 1)
+    print(f"{scale}: {conf['ncycles']} cycles of {conf['nyears']} years, "
+          f"slices {conf['slices']}, grid {conf['nx']}x{conf['ny']}")
+
+    # archive
+    ppdirs = timed("generate archive", pp.make_pp_archive, rootdir,
+                   ncycles=conf['ncycles'], nyears=conf['nyears'],
+                   slices=conf['slices'], stream=stream, fields=(var, 'sos'),
+                   nx=conf['nx'], ny=conf['ny'])
+    reps = [pp.create_pp_path(ppdir, stream) for ppdir in ppdirs]
+
+    # discovery
+    found = timed("find_monofield_files", lambda: [pp.find_monofield_files(rep, var)
+                                                   for rep in reps])
+    list_of_cycles = timed("build_mixed_slices_listfiles",
+                           lambda: [pp.build_mixed_slices_listfiles(files)
+                                    for files in found])
+    timed("cover_time_range", lambda: [pp.cover_time_range(files)
+                                       for files in found])
+    catalog = f"{rootdir}/catalog.db"
+    timed("refresh_catalog (cold)", lambda: [pp.refresh_catalog(catalog, rep)
+                                             for rep in reps])
+    timed("refresh_catalog (warm)", lambda: [pp.refresh_catalog(catalog, rep)
+                                             for rep in reps])
+    timed("create_timeserie_monofield (db)",
+          lambda: [pp.create_timeserie_monofield(rep, var, catalog=catalog)
+                   for rep in reps])
+
+    # planning
+    timed("build_merge_plan (headers)", pp.build_merge_plan, list_of_cycles,
+          gaps=gaps, nyears_file=conf['nyears_file'], read_all=False)
+    plan = timed("build_merge_plan (all files)", pp.build_merge_plan,
+                 list_of_cycles, gaps=gaps, nyears_file=conf['nyears_file'])
+
+    # merging
+    ds1 = pp.open_cycle(list_of_cycles[0])
+    ds2 = pp.open_cycle(list_of_cycles[1])
+    timed("merge_2_datasets", pp.merge_2_datasets, ds1, ds2)
+    ds = timed("merge_cycles", pp.merge_cycles, list_of_cycles, gaps=gaps)
+    timed("merge_from_plan (one window)", pp.merge_from_plan, plan,
+          *plan['windows'][0])
+
+    # writing
+    outdir = f"{rootdir}/out"
+    timed("write_timeseries_chunks", pp.write_timeseries_chunks, ds,
+          f"{outdir}/nc3", conf['nyears_file'], stream, var,
+          nyears_cycles=nyears_cycles, gaps=gaps)
+    timed("write_timeseries_chunks (nc4)", pp.write_timeseries_chunks, ds,
+          f"{outdir}/nc4", conf['nyears_file'], stream, var,
+          nyears_cycles=nyears_cycles, gaps=gaps, format="NETCDF4",
+          complevel=4)
+    timed("write_merged_windows", pp.write_merged_windows,
+          pp.stream_merge_cycles(list_of_cycles, conf['nyears_file'],
+                                 gaps=gaps, plan=plan),
+          f"{outdir}/stream", stream, var)
+
+    if not args.keep:
+        shutil.rmtree(rootdir, ignore_errors=True)
+
+if args.workdir is None and not args.keep:
+    shutil.rmtree(workdir, ignore_errors=True)
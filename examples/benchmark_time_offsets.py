@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+import argparse
+import time
+import numpy as np
+import cftime
+import fre_pp_interface as pp
+
+
+#-- simple argument parser
+parser = argparse.ArgumentParser()
+parser.add_argument(
+            "-y",
+            "--years",
+            type=int,
+            default=360,
+            help="number of years of daily data to shift",
+        )
+
+args = parser.parse_args()
+
+calendars = ['noleap', '360_day', 'all_leap', 'julian',
+             'proleptic_gregorian', 'standard']
+
+# correctness: day offsets between shifted origins against cftime
+rng = np.random.default_rng(42)
+for calendar in calendars:
+    for year1, nyears in zip(rng.integers(1, 3000, 500), rng.integers(0, 400, 500)):
+        year1, year2 = int(year1), int(year1 + nyears)
+        expected = cftime.date2num(cftime.datetime(year2, 1, 1, calendar=calendar),
+                                   f"days since {year1:04d}-01-01 00:00:00",
+                                   calendar=calendar)
+        ndays = pp.days_between_years(year1, year2, calendar)
+        assert ndays == expected, f"{calendar} {year1}-{year2}: {ndays} != {expected}"
+    print(f"{calendar}: days_between_years matches cftime")
+
+# speed: shift a daily time axis by a number of years
+for calendar in calendars:
+    ndays = pp.days_between_years(1900, 1900 + args.years, calendar)
+    time_values = np.arange(ndays) + 0.5
+    units = "days since 1900-01-01 00:00:00"
+    new_units = "days since 1840-01-01 00:00:00"
+
+    tic = time.perf_counter()
+    dates = cftime.num2date(time_values, units, calendar=calendar)
+    shifted_cftime = cftime.date2num(dates, new_units, calendar=calendar)
+    elapsed_cftime = time.perf_counter() - tic
+
+    tic = time.perf_counter()
+    offset = pp.days_between_years(1840, 1900, calendar)
+    shifted = time_values + offset
+    elapsed = time.perf_counter() - tic
+
+    assert np.array_equal(shifted, shifted_cftime)
+    print(f"{calendar}: {len(time_values)} values, cftime {elapsed_cftime:.3f}s, "
+          f"numeric {elapsed:.5f}s (speedup {elapsed_cftime / elapsed:.0f}x)")
@@ -1,12 +1,8 @@
 #!/usr/bin/env python
 
-import xarray as xr
 import fre_pp_interface as pp
 import argparse
-import subprocess as sp
-import numpy as np
-import cftime
-import netCDF4 as nc
+import atexit
 
 
 #-- simple argument parser
@@ -50,7 +46,48 @@ parser.add_argument(
             help="override for frequency",
         )
 
+parser.add_argument(
+            "-c",
+            "--catalog",
+            type=str,
+            required=False,
+            help="file catalog database, refreshed and queried instead of walking directories",
+        )
+
+parser.add_argument(
+            "-u",
+            "--update",
+            action="store_true",
+            help="only rewrite output files whose source files changed since the last run",
+        )
+
+parser.add_argument(
+            "--format",
+            type=str,
+            required=False,
+            default="NETCDF3_64BIT",
+            choices=["NETCDF3_64BIT", "NETCDF4", "NETCDF4_CLASSIC", "zarr"],
+            help="output format, zarr writes (or extends) a single store",
+        )
+
+parser.add_argument(
+            "--complevel",
+            type=int,
+            required=False,
+            help="compression level for NETCDF4 output",
+        )
+
+parser.add_argument(
+            "-r",
+            "--report",
+            type=str,
+            required=False,
+            help="json file where time, files, bytes and memory of each stage are reported",
+        )
+
 args = parser.parse_args()
+if args.update and args.format == "zarr":
+    parser.error("zarr stores are extended without --update")
 
 #- make it a dict for easy use
 dictargs = vars(args)
@@ -60,54 +97,17 @@ nyears_file = dictargs['years']
 cyears = str(nyears_file)
 outputdir = dictargs['outdir']
 freq = dictargs['freq']
+catalog = dictargs['catalog']
+update = dictargs['update']
+outformat = dictargs['format']
+complevel = dictargs['complevel']
+report = dictargs['report']
 
+if report is not None:
+    # report is written when the script exits
+    pp.enable_instrumentation()
+    atexit.register(pp.instrumentation_report, report)
 
-def create_pp_path(ppdir, stream, freq=None):
-    """ fill in the path to timeserie """
-    # default freq is monthly, override if find other freq in stream name
-    dfreq='monthly'
-    if 'annual' in stream:
-        dfreq='annual'
-    elif 'daily' in stream:
-        dfreq='daily'
-    if freq is not None:
-        dfreq=freq
-    pp_path = f'{ppdir}/{stream}/ts/{dfreq}'
-    return pp_path
-
-
-def create_out_path(outputdir, stream, cyears, freq=None):
-    # default freq is monthly, override if find other freq in stream name
-    dfreq='monthly'
-    if 'annual' in stream:
-        dfreq='annual'
-    elif 'daily' in stream:
-        dfreq='daily'
-    if freq is not None:
-        dfreq=freq
-    out_path = f"{outputdir}/{stream}/ts/{dfreq}/{cyears}yr"
-    return out_path
-
-
-def output_filename(stream, start_year, end_year, var, freq=None):
-
-    dfreq='monthly'
-    if 'annual' in stream:
-        dfreq='annual'
-    elif 'daily' in stream:
-        dfreq='daily'
-    if freq is not None:
-        dfreq=freq
-
-    if dfreq == "annual":
-        fout = f"{stream}.{start_year}-{end_year}.{var}.nc"
-    elif dfreq == "monthly":
-        fout = f"{stream}.{start_year}01-{end_year}12.{var}.nc"
-    elif dfreq == "daily":
-        fout = f"{stream}.{start_year}0101-{end_year}1231.{var}.nc"
-    else:
-        raise ValueError(f"{dfreq} not supported")
-    return fout
 
 # this needs not be changed
 cycle1dir = '/archive/Alistair.Adcroft/xanadu_esm4_20190304_mom6_2019.07.21/OM4p25_JRA55do1.4_0netfw/gfdl.ncrc4-intel16-prod/pp'
@@ -119,117 +119,42 @@ cycle6dir = '/archive/Raphael.Dussin/xanadu_esm4_20190304_mom6_2019.08.08/OM4p25
 
 # figure out the list of files:
 
-files_1 = pp.create_timeserie_monofield(create_pp_path(cycle1dir, stream, freq), var)
-files_2 = pp.create_timeserie_monofield(create_pp_path(cycle2dir, stream, freq), var)
-files_3 = pp.create_timeserie_monofield(create_pp_path(cycle3dir, stream, freq), var)
-files_4 = pp.create_timeserie_monofield(create_pp_path(cycle4dir, stream, freq), var)
-files_5 = pp.create_timeserie_monofield(create_pp_path(cycle5dir, stream, freq), var)
-files_6 = pp.create_timeserie_monofield(create_pp_path(cycle6dir, stream, freq), var)
-
-
-def create_dmget_string(files):
-    """ create one long dmget command """
-    dmget_cmd = "dmget -v "
-    for f in files:
-        dmget_cmd += f"{f} "
-    return dmget_cmd
-
-
-print(f"cycle 1: fetching {len(files_1)} files for {var} in {stream}..." )
-sp.check_call(create_dmget_string(files_1), shell=True)
-print("dmget done")
-
-print(f"cycle 2: fetching {len(files_2)} files for {var} in {stream}..." )
-sp.check_call(create_dmget_string(files_2), shell=True)
-print("dmget done")
-
-print(f"cycle 3: fetching {len(files_3)} files for {var} in {stream}..." )
-sp.check_call(create_dmget_string(files_3), shell=True)
-print("dmget done")
-
-print(f"cycle 4: fetching {len(files_4)} files for {var} in {stream}..." )
-sp.check_call(create_dmget_string(files_4), shell=True)
-print("dmget done")
-
-print(f"cycle 5: fetching {len(files_5)} files for {var} in {stream}..." )
-sp.check_call(create_dmget_string(files_5), shell=True)
-print("dmget done")
+cycledirs = [pp.create_pp_path(cycledir, stream, freq) for cycledir in
+             [cycle1dir, cycle2dir, cycle3dir, cycle4dir, cycle5dir, cycle6dir]]
 
-print(f"cycle 6: fetching {len(files_6)} files for {var} in {stream}..." )
-sp.check_call(create_dmget_string(files_6), shell=True)
-print("dmget done")
+if catalog is not None:
+    for cycledir in cycledirs:
+        pp.refresh_catalog(catalog, cycledir)
 
-# open all files in a single dataset using time fixes from fre_pp_interface
-ds =  pp.merge_cycles([files_1, files_2, files_3, files_4,files_5, files_6], gaps=[0,0,0,3,3])
+files_1, files_2, files_3, files_4, files_5, files_6 = [
+    pp.create_timeserie_monofield(cycledir, var, catalog=catalog) for cycledir in cycledirs]
 
-ds = xr.decode_cf(ds, decode_timedelta=False)
+dirout = pp.create_out_path(outputdir, stream, cyears, freq)
 
-first_year = ds.isel(time=0)['time'].dt.year.values
-last_year = ds.isel(time=-1)['time'].dt.year.values
+if update:
+    # compare source files with the manifest of the previous run
+    pp.recall_files(files_1 + files_2 + files_3 + files_4 + files_5 + files_6,
+                    skip_online=True)
+    pp.update_timeseries([files_1, files_2, files_3, files_4, files_5, files_6],
+                         dirout, nyears_file, stream, var, freq, gaps=[0,0,0,3,3],
+                         format=outformat, complevel=complevel)
+    raise SystemExit
 
-dirout = create_out_path(outputdir, stream, cyears)
-sp.check_call(f"mkdir -p {dirout}", shell=True)
+# open all files in a single dataset using time fixes from fre_pp_interface,
+# files of the next cycle are recalled from tape while a cycle is merged
+ds = pp.pipelined_merge_cycles([files_1, files_2, files_3, files_4, files_5, files_6],
+                               gaps=[0,0,0,3,3], skip_online=True)
 
 # number of years in each cycle
-nyears_cycles = np.array([60, 60, 60, 61, 61, 61])
-prev_gaps = np.array([0, 0, 0, 0, 3, 3])
-
-# find out how many years are left to add in the last file
-extra_years = np.mod(nyears_cycles, nyears_file)
-# this is how many files to create for this cycle, last one will include extra years
-files_per_cycles = (nyears_cycles - extra_years) / nyears_file
-
-# build start and end dates for each file
-startyears = []
-endyears = []
-
-beginyear = first_year
-
-for cycle in range(6):
-    #print(f"cycle {cycle} will write {int(files_per_cycles[cycle])} files")
-    for nf in range(int(files_per_cycles[cycle])):
-        startyear = beginyear
-        if nf == 0:  # first file account for gap year, if any
-            startyear += prev_gaps[cycle]
-        endyear = startyear + nyears_file -1
-        if nf == files_per_cycles[cycle] -1:  # last file has extra years, if any
-            #print(f"add {extra_years[cycle]} to file {nf+1}")
-            endyear += extra_years[cycle]
-        #print(f"{startyear}-{endyear}")
-        startyears.append(startyear)
-        endyears.append(endyear)
-        # reset beginyear
-        beginyear = endyear + 1
-
-# loop over start and end dates for each file
-for start_year, end_year in zip(startyears, endyears):
-
-    print(f"extracting time period {start_year} - {end_year}")
-    ds_split = ds.sel(time=slice(str(start_year), str(end_year)))
-
-    # fix _FillValue
-    for kvar in list(ds_split.coords):
-        ds_split[kvar].encoding.update({"_FillValue": None})
-    for kvar in ["average_T1", "average_T2", "time_bnds"]:
-        fillval = cftime.date2num(cftime.DatetimeJulian(1599,12,31),
-                                  "days since 1600-01-01T0:00:00", calendar="julian")
-        ds_split[kvar].encoding.update({"dtype": np.float64, "_FillValue": fillval})
-        ds_split[kvar].attrs.update({"missing_value": fillval})
-    if "lon_bnds" in list(ds.variables):
-        ds_split["lon_bnds"].encoding.update({"_FillValue": 1.e+20})
-    if "lat_bnds" in list(ds.variables):
-        ds_split["lat_bnds"].encoding.update({"_FillValue": 1.e+20})
-
-    fout = output_filename(stream, start_year, end_year, var, freq)
-
-    # write file
-    print(f"writing into file {dirout}/{fout}")
-    ds_split.attrs["filename"] = f"{fout}"
-    ds_split.to_netcdf(f"{dirout}/{fout}", unlimited_dims="time", format="NETCDF3_64BIT")
-
-    # xarray uses bounds attribute of time to define attrs of time_bnds
-    # hence messing up our attrs. So we add this attribute in a "append" call
-    # using low level netcdf
-    f = nc.Dataset(f"{dirout}/{fout}", "a")
-    f.variables["time"].setncattr("bounds", "time_bnds")
-    f.close()
+nyears_cycles = [60, 60, 60, 61, 61, 61]
+
+if outformat == "zarr":
+    # one store for the whole run, new time steps are appended to it
+    pp.write_zarr(ds, f"{outputdir}/{stream}.{var}.zarr", append=True)
+    raise SystemExit
+
+# split into files of nyears_file years, last file of each cycle
+# includes extra years
+pp.write_timeseries_chunks(ds, dirout, nyears_file, stream, var, freq,
+                           nyears_cycles=nyears_cycles, gaps=[0,0,0,3,3],
+                           format=outformat, complevel=complevel)
@@ -1,3 +1,36 @@
-from .timeserie_interface import *
-from .ppan_utils import *
-from .cycles import *
+import importlib
+
+# Modules are imported when one of their names is first used, so that
+# finding and recalling files does not pay for importing xarray, numpy and
+# netCDF4. Light modules (standard library only) are searched first.
+_LIGHT_MODULES = ['timeserie_interface', 'catalog', 'ppan_utils', 'instrument']
+_HEAVY_MODULES = ['calendars', 'plan', 'cycles', 'writer', 'reductions',
+                  'synthetic', 'batch']
+
+
+def __getattr__(name):
+    """ import the first module defining name """
+    if name == '__all__':
+        # from fre_pp_interface import * still imports everything
+        return [name for name in __dir__() if not name.startswith('_')]
+    if name.startswith('__'):
+        raise AttributeError(name)
+    if name in _LIGHT_MODULES + _HEAVY_MODULES + ['cli']:
+        # submodule, e.g. fre_pp_interface.cycles
+        return importlib.import_module(f'.{name}', __name__)
+    for modname in _LIGHT_MODULES + _HEAVY_MODULES:
+        module = importlib.import_module(f'.{modname}', __name__)
+        if hasattr(module, name):
+            value = getattr(module, name)
+            globals()[name] = value
+            return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    """ names of all modules, imports them all """
+    names = set(globals())
+    for modname in _LIGHT_MODULES + _HEAVY_MODULES:
+        module = importlib.import_module(f'.{modname}', __name__)
+        names.update(name for name in vars(module) if not name.startswith('_'))
+    return sorted(names)
@@ -0,0 +1,222 @@
+import argparse
+import multiprocessing
+import resource
+from concurrent.futures import ProcessPoolExecutor
+from dask.utils import parse_bytes
+from .catalog import refresh_catalog
+from .cycles import stream_merge_cycles
+from .plan import build_merge_plan
+from .ppan_utils import recall_files
+from .timeserie_interface import (build_mixed_slices_listfiles, create_pp_path,
+                                  find_multifield_files)
+from .writer import create_out_path, update_timeseries, write_merged_windows
+
+# Merge and split many fields of many streams of the same experiment:
+# files are found and recalled once for all fields, then each field is
+# merged and written by its own job on a pool of processes (or on a local
+# dask cluster).
+
+
+def run_batch(ppdirs, outdir, streams, nyears, variables=None, gaps=None,
+              freq=None, catalog=None, recall=True, nworkers=4,
+              memory_limit=None, use_dask=False, update=False,
+              format="NETCDF3_64BIT", complevel=None, cache_grid=False):
+    """ merge cycles and write timeseries of nyears years for all
+    variables of all streams
+
+    ppdirs = pp directory of each cycle
+    streams = list of streams
+    variables = list of variables for all streams, or dictionary
+                {stream: list of variables}, None or 'all' for all
+                variables found in a stream
+    gaps = list of gap year (e.g. 1) between cycles
+    catalog = optional catalog database used to find files
+    recall = recall files from tape (once for all jobs) before merging
+    nworkers = number of jobs running at the same time
+    memory_limit = maximum memory of each job, in bytes or as a string
+                   (e.g. '8GB'). With a process pool this caps the virtual
+                   address space of each process (RLIMIT_AS), which netCDF/
+                   HDF5 libraries and threads can fill well beyond resident
+                   memory: allow some margin, or use use_dask to limit the
+                   resident memory of dask workers instead
+    use_dask = run jobs on a dask LocalCluster instead of a process pool
+    update = only rewrite output files whose source files changed
+             (see update_timeseries)
+    cache_grid = read static variables (grid) once per job instead of
+                 comparing them in every file (see open_cycle)
+
+    returns a dictionary {(stream, variable): list of written files, or
+    the error message if the job failed}
+    """
+    jobs = find_batch_jobs(ppdirs, streams, variables=variables, freq=freq,
+                           catalog=catalog)
+    print(f"{len(jobs)} jobs for streams {streams}")
+    if recall:
+        files = [f for job in jobs for files in job[2] for f in files]
+        failed = [f for f, ok in recall_files(files, skip_online=True).items()
+                  if not ok]
+        if failed:
+            raise RuntimeError(f"could not recall {failed}")
+
+    if isinstance(memory_limit, str):
+        memory_limit = parse_bytes(memory_limit)
+    options = {'outdir': outdir, 'nyears': nyears, 'gaps': gaps,
+               'freq': freq, 'update': update, 'format': format,
+               'complevel': complevel, 'cache_grid': cache_grid}
+    results = {}
+    if use_dask:
+        from dask.distributed import Client, LocalCluster
+        with LocalCluster(n_workers=nworkers, threads_per_worker=1,
+                          memory_limit=memory_limit or 'auto') as cluster:
+            with Client(cluster) as client:
+                futures = {(stream, var): client.submit(run_job, stream, var,
+                                                        list_of_cycles,
+                                                        pure=False, **options)
+                           for stream, var, list_of_cycles in jobs}
+                for key, future in futures.items():
+                    results[key] = _job_result(key, future)
+    else:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=nworkers, mp_context=context,
+                                 initializer=limit_memory,
+                                 initargs=(memory_limit,)) as pool:
+            futures = {(stream, var): pool.submit(run_job, stream, var,
+                                                  list_of_cycles, **options)
+                       for stream, var, list_of_cycles in jobs}
+            for key, future in futures.items():
+                results[key] = _job_result(key, future)
+    return results
+
+
+def find_batch_jobs(ppdirs, streams, variables=None, freq=None, catalog=None):
+    """ find files of all variables of all streams, listing each cycle
+    directory only once per stream
+
+    returns a list of (stream, variable, files of each cycle)
+    """
+    jobs = []
+    for stream in streams:
+        stream_variables = variables
+        if isinstance(variables, dict):
+            stream_variables = variables.get(stream)
+        if stream_variables == 'all':
+            stream_variables = None
+        reps = [create_pp_path(ppdir, stream, freq) for ppdir in ppdirs]
+        if catalog is not None:
+            for rep in reps:
+                refresh_catalog(catalog, rep)
+        cycles = [find_multifield_files(rep, fields=stream_variables,
+                                        catalog=catalog)
+                  for rep in reps]
+        if stream_variables is None:
+            stream_variables = sorted(set().union(*cycles))
+        for var in stream_variables:
+            list_of_cycles = [build_mixed_slices_listfiles(fields.get(var, []))
+                              for fields in cycles]
+            if not all(list_of_cycles):
+                print(f"skipping {stream} {var}: missing in some cycles")
+                continue
+            jobs.append((stream, var, list_of_cycles))
+    return jobs
+
+
+def run_job(stream, var, list_of_cycles, outdir, nyears, gaps=None,
+            freq=None, update=False, format="NETCDF3_64BIT", complevel=None,
+            cache_grid=False):
+    """ merge cycles of one variable and write its timeseries, one output
+    file at a time. Returns the list of written files.
+
+    cache_grid = share the static variables of the stream between all
+                 output files (see open_cycle)
+    """
+    dirout = create_out_path(outdir, stream, nyears, freq)
+    if update:
+        return update_timeseries(list_of_cycles, dirout, nyears, stream, var,
+                                 freq=freq, gaps=gaps, format=format,
+                                 complevel=complevel)
+    # headers are read in this process: jobs may run in daemonic processes
+    # (dask workers) which can not start a pool
+    plan = build_merge_plan(list_of_cycles, gaps=gaps, nyears_file=nyears,
+                            nworkers=1, read_all=False)
+    grid_cache = {} if cache_grid else None
+    windows = stream_merge_cycles(list_of_cycles, nyears, plan=plan,
+                                  grid_cache=grid_cache)
+    return write_merged_windows(windows, dirout, stream, var, freq=freq,
+                                format=format, complevel=complevel)
+
+
+def limit_memory(memory_limit):
+    """ limit the virtual address space (not the resident memory) of the
+    current process to memory_limit bytes (no limit if None) """
+    if memory_limit is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def _job_result(key, future):
+    """ result of a job, or error message if it failed """
+    try:
+        return future.result()
+    except Exception as error:
+        print(f"job {key[0]} {key[1]} failed: {error!r}")
+        return repr(error)
+
+
+def main(argv=None):
+    """ command line entry point of run_batch """
+    parser = argparse.ArgumentParser(
+        description="merge cycles and split timeseries of many variables")
+    parser.add_argument("-p", "--ppdirs", type=str, nargs="+", required=True,
+                        help="pp directory of each cycle")
+    parser.add_argument("-s", "--streams", type=str, nargs="+", required=True,
+                        help="pp stream names (e.g. ocean_monthly)")
+    parser.add_argument("-v", "--variables", type=str, nargs="+",
+                        default=["all"],
+                        help="variable names, or all (default)")
+    parser.add_argument("-o", "--outdir", type=str, required=True,
+                        help="output pp directory")
+    parser.add_argument("-y", "--years", type=int, required=True,
+                        help="number of years in output files (e.g. 20)")
+    parser.add_argument("-g", "--gaps", type=int, nargs="+",
+                        help="gap years between cycles")
+    parser.add_argument("-f", "--freq", type=str,
+                        help="override for frequency")
+    parser.add_argument("-c", "--catalog", type=str,
+                        help="file catalog database")
+    parser.add_argument("-n", "--nworkers", type=int, default=4,
+                        help="number of jobs running at the same time")
+    parser.add_argument("-m", "--memory-limit", type=str,
+                        help="memory limit of each job (e.g. 8GB), caps "
+                        "the address space of each process, or the resident "
+                        "memory of workers with --dask")
+    parser.add_argument("--dask", action="store_true",
+                        help="run jobs on a local dask cluster")
+    parser.add_argument("--no-recall", action="store_true",
+                        help="do not recall files from tape")
+    parser.add_argument("-u", "--update", action="store_true",
+                        help="only rewrite output files whose source files changed")
+    parser.add_argument("--format", type=str, default="NETCDF3_64BIT",
+                        choices=["NETCDF3_64BIT", "NETCDF4", "NETCDF4_CLASSIC"],
+                        help="output format")
+    parser.add_argument("--complevel", type=int,
+                        help="compression level for NETCDF4 output")
+    parser.add_argument("--cache-grid", action="store_true",
+                        help="read static variables once per job")
+    args = parser.parse_args(argv)
+
+    variables = None if args.variables == ["all"] else args.variables
+    results = run_batch(args.ppdirs, args.outdir, args.streams, args.years,
+                        variables=variables, gaps=args.gaps, freq=args.freq,
+                        catalog=args.catalog, recall=not args.no_recall,
+                        nworkers=args.nworkers, memory_limit=args.memory_limit,
+                        use_dask=args.dask, update=args.update,
+                        format=args.format, complevel=args.complevel,
+                        cache_grid=args.cache_grid)
+    failed = [key for key, result in results.items() if isinstance(result, str)]
+    if failed:
+        print(f"{len(failed)} jobs failed: {failed}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,190 @@
+import datetime as dt
+import math
+import numpy as np
+
+# Calendar arithmetic on "days since" values, without building arrays of
+# cftime objects. Years follow the astronomical numbering used by cftime
+# for proleptic calendars.
+
+# mean number of days per year for each CF calendar
+DAYS_PER_YEAR = {'noleap': 365.,
+                 '365_day': 365.,
+                 'all_leap': 366.,
+                 '366_day': 366.,
+                 '360_day': 360.,
+                 'julian': 365.25,
+                 'proleptic_gregorian': 365.2425,
+                 'gregorian': 365.2425,
+                 'standard': 365.2425}
+
+# legacy calendar names accepted by merge functions
+CALENDAR_ALIASES = {'leap': 'julian'}
+
+# the standard (mixed) calendar switches from julian to gregorian in 1582,
+# removing 10 days in October
+GREGORIAN_START_YEAR = 1583
+GREGORIAN_SKIPPED_DAYS = 10
+
+
+def check_calendar(calendar):
+    """ return the CF name of calendar, raise ValueError if unsupported """
+    calendar = calendar.lower()
+    calendar = CALENDAR_ALIASES.get(calendar, calendar)
+    if calendar not in DAYS_PER_YEAR:
+        raise ValueError(f"calendar {calendar} not supported")
+    return calendar
+
+
+def days_per_year(calendar):
+    """ mean number of days in one year of calendar """
+    return DAYS_PER_YEAR[check_calendar(calendar)]
+
+
+def days_in_year(year, calendar):
+    """ number of days in year """
+    return days_between_years(year, year + 1, calendar)
+
+
+def days_between_years(year1, year2, calendar):
+    """ number of days between January 1st of year1 and January 1st
+    of year2 """
+    return days_before_year(year2, calendar) - days_before_year(year1, calendar)
+
+
+def days_before_year(year, calendar):
+    """ number of days between January 1st of year 0 and January 1st
+    of year """
+    calendar = check_calendar(calendar)
+    if calendar in ['noleap', '365_day', 'all_leap', '366_day', '360_day']:
+        return int(DAYS_PER_YEAR[calendar]) * year
+    elif calendar == 'julian':
+        return 365 * year + _julian_leaps_before(year)
+    elif calendar == 'proleptic_gregorian':
+        return 365 * year + _gregorian_leaps_before(year)
+    # standard calendar, julian then gregorian
+    if year <= GREGORIAN_START_YEAR:
+        ndays = 365 * year + _julian_leaps_before(year)
+        if year == GREGORIAN_START_YEAR:
+            ndays -= GREGORIAN_SKIPPED_DAYS
+        return ndays
+    return (days_before_year(GREGORIAN_START_YEAR, calendar) +
+            365 * (year - GREGORIAN_START_YEAR) +
+            _gregorian_leaps_before(year) -
+            _gregorian_leaps_before(GREGORIAN_START_YEAR))
+
+
+def year_of_day(days, origin_year, calendar):
+    """ year of the date days after January 1st of origin_year """
+    target = days_before_year(origin_year, calendar) + days
+    year = origin_year + int(days // days_per_year(calendar))
+    while days_before_year(year, calendar) > target:
+        year -= 1
+    while days_before_year(year + 1, calendar) <= target:
+        year += 1
+    return year
+
+
+def years_of_days(days, origin_year, calendar):
+    """ year of each date given as days since January 1st of origin_year
+    (array version of year_of_day) """
+    days = np.asarray(days, dtype=float)
+    if days.size == 0:
+        return np.zeros(days.shape, dtype=int)
+    ndpy = days_per_year(calendar)
+    first = origin_year + int(math.floor(np.nanmin(days) / ndpy)) - 1
+    last = origin_year + int(math.ceil(np.nanmax(days) / ndpy)) + 1
+    years = np.arange(first, last + 1)
+    starts = np.array([days_between_years(origin_year, year, calendar)
+                       for year in years], dtype=float)
+    return years[np.searchsorted(starts, days, side='right') - 1]
+
+
+def relabel_years(days, origin_year, new_origin_year, calendar):
+    """ move dates given as days since January 1st of origin_year by the
+    number of years between origin_year and new_origin_year (keeping the
+    day of the year) and return them as days since January 1st of
+    new_origin_year. Values only change in calendars with leap years. """
+    days = np.asarray(days, dtype=float)
+    if days.size == 0 or days_per_year(calendar) in [360., 365., 366.]:
+        return days
+    ndpy = days_per_year(calendar)
+    first = origin_year + int(math.floor(np.nanmin(days) / ndpy)) - 1
+    last = origin_year + int(math.ceil(np.nanmax(days) / ndpy)) + 1
+    years = range(first, last + 1)
+    starts = np.array([days_between_years(origin_year, year, calendar)
+                       for year in years], dtype=float)
+    new_starts = np.array([days_between_years(new_origin_year,
+                                              year + new_origin_year - origin_year,
+                                              calendar)
+                           for year in years], dtype=float)
+    index = np.clip(np.searchsorted(starts, days, side='right') - 1,
+                    0, len(starts) - 1)
+    return new_starts[index] + days - starts[index]
+
+
+def compute_cycle_offsets(spans, gaps=None, calendar=None):
+    """ compute the offset (in days) to add to the time values of each
+    cycle and the units of the merged time axis
+
+    spans = list of (first time, last time, units, calendar) for each cycle
+    gaps = list of gap year (e.g. 1) between cycles
+    calendar = override for the calendar of the cycles
+
+    returns (list of offsets, units)
+    """
+    if calendar is None:
+        calendar = spans[0][3]
+    calendar = check_calendar(calendar)
+    ndpy = days_per_year(calendar)
+    start, end, units = spans[0][:3]
+    # first year of each cycle's time axis, and of the merged time axis when
+    # the cycle was appended
+    origin_years = [origin_from_units(units).year]
+    merged_years = [origin_years[0]]
+    for cycle in range(1, len(spans)):
+        gap = gaps[cycle-1] if gaps is not None else 0
+        # time is given in days since origin,
+        # we always come short of the last year
+        nyears = int(math.floor((end - start)/ndpy + 1))
+        origin_cycle1 = origin_from_units(units)
+        origin_cycle2 = origin_from_units(spans[cycle][2])
+
+        # set the new origin the past
+        offset_years = origin_cycle1.year + nyears - origin_cycle2.year + gap
+        new_year_start = int(origin_cycle1.year - offset_years)
+        origin = dt.datetime(new_year_start,1,1,0,0,0)
+        units = dt.datetime.strftime(origin, "days since %Y-%m-%d %H:%M:%S")
+
+        # shift nyears of the previous cycles in the future
+        offset = days_between_years(new_year_start,
+                                    new_year_start + nyears + gap, calendar)
+        end = spans[cycle][1] + offset
+        origin_years.append(origin_cycle2.year)
+        merged_years.append(new_year_start)
+
+    # previous cycles move back in time each time a cycle is appended:
+    # express all offsets from the final origin so that each cycle starts
+    # on January 1st of its (shifted) first year in any calendar
+    final_year = merged_years[-1]
+    offsets = []
+    for origin_year, merged_year in zip(origin_years, merged_years):
+        start_year = origin_year + final_year - merged_year
+        offsets.append(float(days_between_years(final_year, start_year,
+                                                calendar)))
+    return offsets, units
+
+
+def origin_from_units(units):
+    """ origin of time axis from units (days since origin) """
+    origin = dt.datetime.strptime(units, "days since %Y-%m-%d %H:%M:%S")
+    return origin
+
+
+def _julian_leaps_before(year):
+    """ number of julian leap years in [0, year) """
+    return (year + 3) // 4
+
+
+def _gregorian_leaps_before(year):
+    """ number of gregorian leap years in [0, year) """
+    return (year + 3) // 4 - (year + 99) // 100 + (year + 399) // 400
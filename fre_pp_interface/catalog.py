@@ -0,0 +1,151 @@
+import os
+import sqlite3
+
+# On-disk catalog of the files of a FRE PP archive. Directories are only
+# listed again when their mtime changed since the last refresh, so
+# refreshing a large archive costs one stat per directory.
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    directory TEXT,
+    stream TEXT,
+    freq TEXT,
+    timeslice TEXT,
+    startdate TEXT,
+    enddate TEXT,
+    field TEXT
+);
+CREATE INDEX IF NOT EXISTS directories_parent ON directories (parent);
+CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+CREATE INDEX IF NOT EXISTS files_field ON files (field, path);
+"""
+
+
+def open_catalog(dbfile):
+    """ open catalog database dbfile, create tables if needed """
+    conn = sqlite3.connect(dbfile)
+    conn.executescript(CATALOG_SCHEMA)
+    return conn
+
+
+def refresh_catalog(dbfile, rep):
+    """ build or incrementally update the catalog for directory rep
+    and return the number of directories that had to be listed """
+    rep = os.path.abspath(rep)
+    conn = open_catalog(dbfile)
+    try:
+        with conn:
+            parent = os.path.dirname(rep)
+            nscanned = _refresh_directory(conn, rep, parent, set())
+    finally:
+        conn.close()
+    return nscanned
+
+
+def query_catalog(dbfile, rep, field=None, pattern=None):
+    """ return files under directory rep from the catalog, for field field
+    with optional pattern (same as find_monofield_files) """
+    lo, hi = _path_range(os.path.abspath(rep))
+    sql = "SELECT path FROM files WHERE path >= ? AND path < ?"
+    params = [lo, hi]
+    if field is not None:
+        sql += " AND field = ?"
+        params.append(field)
+    if pattern is not None:
+        sql += " AND instr(path, ?) > 0"
+        params.append(pattern)
+    conn = open_catalog(dbfile)
+    try:
+        matches = [row[0] for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+    return matches
+
+
+def split_pp_path(path):
+    """ break path of a PP timeserie file into
+    (stream, freq, timeslice, start, end, field), None if not a PP file """
+    parts = path.split('/')
+    if len(parts) < 3:
+        return None
+    fname = parts[-1]
+    elements = fname.split('.', 2)
+    if len(elements) != 3 or not elements[2].endswith('.nc'):
+        return None
+    stream, cdates, rest = elements
+    if cdates.count('-') != 1:
+        return None
+    start, end = cdates.split('-')
+    field = rest[:-3]
+    timeslice = parts[-2]
+    freq = parts[-3]
+    return stream, freq, timeslice, start, end, field
+
+
+def _path_range(rep):
+    """ bounds of all paths below rep, usable with the primary key index
+    ('0' is the character following '/') """
+    rep = rep.rstrip('/')
+    return rep + '/', rep + '0'
+
+
+def _refresh_directory(conn, directory, parent, visited):
+    """ recursively update catalog for directory
+
+    visited = real paths of directories already refreshed, directories
+              reached again through symbolic links are skipped
+    """
+    try:
+        mtime = os.stat(directory).st_mtime
+    except FileNotFoundError:
+        _forget_directory(conn, directory)
+        return 0
+    realpath = os.path.realpath(directory)
+    if realpath in visited:
+        return 0
+    visited.add(realpath)
+    row = conn.execute("SELECT mtime FROM directories WHERE path = ?",
+                       (directory,)).fetchone()
+    known = [r[0] for r in conn.execute(
+        "SELECT path FROM directories WHERE parent = ?", (directory,))]
+    if row is not None and row[0] == mtime:
+        # nothing added or removed here, only look at subdirectories
+        subdirs = known
+        nscanned = 0
+    else:
+        subdirs = []
+        rows = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=True):
+                    subdirs.append(entry.path)
+                elif entry.name.endswith('.nc'):
+                    elements = split_pp_path(entry.path)
+                    if elements is not None:
+                        rows.append((entry.path, directory) + elements)
+        conn.execute("DELETE FROM files WHERE directory = ?", (directory,))
+        conn.executemany("INSERT OR REPLACE INTO files "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        for gone in set(known) - set(subdirs):
+            _forget_directory(conn, gone)
+        conn.execute("INSERT OR REPLACE INTO directories VALUES (?, ?, ?)",
+                     (directory, parent, mtime))
+        nscanned = 1
+    for sub in subdirs:
+        nscanned += _refresh_directory(conn, sub, directory, visited)
+    return nscanned
+
+
+def _forget_directory(conn, directory):
+    """ remove directory and everything below it from the catalog """
+    lo, hi = _path_range(directory)
+    conn.execute("DELETE FROM files WHERE directory = ? OR "
+                 "(path >= ? AND path < ?)", (directory, lo, hi))
+    conn.execute("DELETE FROM directories WHERE path = ? OR "
+                 "(path >= ? AND path < ?)", (directory, lo, hi))
@@ -0,0 +1,163 @@
+import argparse
+from .catalog import refresh_catalog
+from .ppan_utils import recall_files
+from .timeserie_interface import (cover_time_range, create_pp_path,
+                                  create_timeserie_monofield,
+                                  find_monofield_files)
+
+# fre-pp command line. list and recall only need the standard library,
+# xarray and netCDF4 are imported by the commands reading files.
+
+
+def main(argv=None):
+    """ entry point of the fre-pp command """
+    parser = argparse.ArgumentParser(
+        prog="fre-pp", description="FRE PP timeseries of several cycles")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="list timeserie files")
+    recall_parser = subparsers.add_parser("recall",
+                                          help="recall timeserie files from tape")
+    plan_parser = subparsers.add_parser("plan", help="save a merge plan as json")
+    merge_parser = subparsers.add_parser("merge",
+                                         help="merge cycles into one file")
+    split_parser = subparsers.add_parser(
+        "split", help="merge cycles into files of a number of years")
+
+    for subparser in [list_parser, recall_parser, plan_parser, merge_parser,
+                      split_parser]:
+        subparser.add_argument("-p", "--ppdirs", type=str, nargs="+",
+                               required=True, help="pp directory of each cycle")
+        subparser.add_argument("-s", "--stream", type=str, required=True,
+                               help="pp stream name (e.g. ocean_monthly)")
+        subparser.add_argument("-v", "--variable", type=str, required=True,
+                               help="variable name")
+        subparser.add_argument("-f", "--freq", type=str,
+                               help="override for frequency")
+        subparser.add_argument("-c", "--catalog", type=str,
+                               help="file catalog database, refreshed and "
+                                    "queried instead of walking directories")
+    for subparser in [list_parser, recall_parser]:
+        subparser.add_argument("--start", type=str,
+                               help="first date (YYYY, YYYYMM or YYYYMMDD)")
+        subparser.add_argument("--end", type=str,
+                               help="last date (YYYY, YYYYMM or YYYYMMDD)")
+    recall_parser.add_argument("-n", "--nworkers", type=int, default=4,
+                               help="number of dmget calls at the same time")
+    for subparser in [plan_parser, merge_parser, split_parser]:
+        subparser.add_argument("-g", "--gaps", type=int, nargs="+",
+                               help="gap years between cycles")
+    for subparser in [plan_parser, split_parser]:
+        subparser.add_argument("-y", "--years", type=int, required=True,
+                               help="number of years in output files")
+    plan_parser.add_argument("-o", "--output", type=str, required=True,
+                             help="json file of the merge plan")
+    merge_parser.add_argument("-o", "--output", type=str, required=True,
+                              help="output netcdf file")
+    merge_parser.add_argument("--start-year", type=int,
+                              help="first year of the merged time axis")
+    merge_parser.add_argument("--end-year", type=int,
+                              help="last year of the merged time axis")
+    split_parser.add_argument("-o", "--outdir", type=str, required=True,
+                              help="output pp directory")
+    for subparser in [merge_parser, split_parser]:
+        subparser.add_argument("--format", type=str, default="NETCDF3_64BIT",
+                               choices=["NETCDF3_64BIT", "NETCDF4",
+                                        "NETCDF4_CLASSIC"],
+                               help="output format")
+        subparser.add_argument("--complevel", type=int,
+                               help="compression level for NETCDF4 output")
+
+    args = parser.parse_args(argv)
+    commands = {"list": list_command, "recall": recall_command,
+                "plan": plan_command, "merge": merge_command,
+                "split": split_command}
+    return commands[args.command](args)
+
+
+def find_cycle_files(args):
+    """ files of variable in each cycle, from the command line arguments """
+    reps = [create_pp_path(ppdir, args.stream, args.freq)
+            for ppdir in args.ppdirs]
+    if args.catalog is not None:
+        for rep in reps:
+            refresh_catalog(args.catalog, rep)
+    start = getattr(args, "start", None)
+    end = getattr(args, "end", None)
+    if start is None and end is None:
+        return [create_timeserie_monofield(rep, args.variable,
+                                           catalog=args.catalog)
+                for rep in reps]
+    list_of_cycles = []
+    for ppdir, rep in zip(args.ppdirs, reps):
+        files, gaps, overlaps = cover_time_range(
+            find_monofield_files(rep, args.variable, catalog=args.catalog),
+            start=start, end=end)
+        for first, last in gaps:
+            print(f"# {ppdir}: no files for {first}-{last}")
+        for previous, following in overlaps:
+            print(f"# {ppdir}: {previous} and {following} overlap")
+        list_of_cycles.append(files)
+    return list_of_cycles
+
+
+def list_command(args):
+    """ print the files of each cycle """
+    for ppdir, files in zip(args.ppdirs, find_cycle_files(args)):
+        print(f"# {ppdir}: {len(files)} files")
+        for f in files:
+            print(f)
+    return 0
+
+
+def recall_command(args):
+    """ recall the files of all cycles from tape """
+    files = [f for files in find_cycle_files(args) for f in files]
+
+    def progress(ndone, ntotal):
+        print(f"recalled {ndone}/{ntotal} files")
+
+    result = recall_files(files, nworkers=args.nworkers, progress=progress,
+                          skip_online=True)
+    failed = [f for f, ok in result.items() if not ok]
+    for f in failed:
+        print(f"could not recall {f}")
+    return 1 if failed else 0
+
+
+def plan_command(args):
+    """ save the merge plan of the cycles """
+    from .plan import build_merge_plan, save_plan
+
+    plan = build_merge_plan(find_cycle_files(args), gaps=args.gaps,
+                            nyears_file=args.years)
+    save_plan(plan, args.output)
+    print(f"merge plan of {len(plan['cycles'])} cycles saved in {args.output}")
+    return 0
+
+
+def merge_command(args):
+    """ merge the cycles into one file """
+    from .cycles import merge_cycles
+    from .writer import write_timeseries
+
+    ds = merge_cycles(find_cycle_files(args), gaps=args.gaps,
+                      start_year=args.start_year, end_year=args.end_year)
+    print(f"writing into file {args.output}")
+    write_timeseries(ds, args.output, format=args.format,
+                     complevel=args.complevel)
+    return 0
+
+
+def split_command(args):
+    """ merge the cycles into files of a number of years """
+    from .batch import run_job
+
+    run_job(args.stream, args.variable, find_cycle_files(args), args.outdir,
+            args.years, gaps=args.gaps, freq=args.freq, format=args.format,
+            complevel=args.complevel)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,116 +1,71 @@
 import xarray as xr
 import numpy as np
-import datetime as dt
-import cftime
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from .ppan_utils import recall_files
+from .instrument import stage
+from .calendars import (compute_cycle_offsets, days_between_years,
+                        origin_from_units)
+from .plan import build_merge_plan, plan_files
 
 
-def merge_2_cycles(files_cycle1, files_cycle2, combine='by_coords'):
+def merge_2_cycles(files_cycle1, files_cycle2, combine='by_coords',
+                   sel=None, isel=None, grid_cache=None):
     """merge files from 2 cycles into one single dataset:
-    deal with repeating time axis in 2 cycles"""
-    if combine == 'nested':
-        kwargs = {'concat_dim': 'time'}
-    else:
-        kwargs = {}
-    ds1 = xr.open_mfdataset(files_cycle1, combine=combine,
-                            decode_times=False, **kwargs)
-    ds2 = xr.open_mfdataset(files_cycle2, combine=combine,
-                            decode_times=False, **kwargs)
+    deal with repeating time axis in 2 cycles
+
+    sel, isel = selections applied to each file when opened (see open_cycle)
+    grid_cache = optional cache of static variables (see open_cycle)
+    """
+    ds1 = open_cycle(files_cycle1, combine=combine, sel=sel, isel=isel,
+                     grid_cache=grid_cache)
+    ds2 = open_cycle(files_cycle2, combine=combine, sel=sel, isel=isel,
+                     grid_cache=grid_cache)
     ds = merge_2_datasets(ds1, ds2)
     return ds
 
 
-def merge_2_datasets(ds1, ds2, calendar='leap', gap=0):
+def merge_2_datasets(ds1, ds2, calendar=None, gap=0):
     """ merge 2 datasets into one long """
-    # time is given in days since origin
-    ndays_cycle1 = ds1['time'][-1].values - ds1['time'][0].values
-    ndays_cycle2 = ds2['time'][-1].values - ds2['time'][0].values
-    # we always come short of the last year
-    #if calendar == 'leap':
-    #    ndpy=365.25
-    #elif calendar == 'noleap':
-    ndpy=365.
-
-    nyears_cycle1 = np.floor(ndays_cycle1/ndpy + 1)
-    nyears_cycle2 = np.floor(ndays_cycle2/ndpy + 1)
-
-    #print(nyears_cycle1, nyears_cycle2)
-    units_cycle1 = ds1['time'].attrs['units']
-    origin_cycle1 = dt.datetime.strptime(units_cycle1,
-                                         "days since %Y-%m-%d %H:%M:%S")
-    calendar_cycle1 = ds1['time'].attrs['calendar']
-
-    units_cycle2 = ds2['time'].attrs['units']
-    origin_cycle2 = dt.datetime.strptime(units_cycle2,
-                                         "days since %Y-%m-%d %H:%M:%S")
-
-    # set the new origin the past
-    #origin = origin_cycle1 - dt.timedelta(days=ndpy*(nyears_cycle2))
-    #origin = origin_cycle1 - dt.timedelta(days=ndays_cycle2+ndpy)
-    offset_years = origin_cycle1.year + nyears_cycle1 - origin_cycle2.year + gap
-    #origin = origin_cycle1 - dt.timedelta(days=(ndpy*offset_years)+1)
-    new_year_start = int(origin_cycle1.year - offset_years)
-    origin =dt.datetime(new_year_start,1,1,0,0,0)
-    units = dt.datetime.strftime(origin, "days since %Y-%m-%d %H:%M:%S")
-
-    # set up the merged time axis
-    # cycle1 values remains the same but the origin is shifted
-    ds1['time'] = cftime.num2date(ds1['time'].values, units,
-                                  calendar=calendar_cycle1)
-    tmp1_avgT1 = cftime.num2date(ds1['average_T1'].values, units,
-                                calendar=calendar_cycle1)
-    tmp1_avgT2 = cftime.num2date(ds1['average_T2'].values, units,
-                                calendar=calendar_cycle1)
-    tmp1_bnds = cftime.num2date(ds1['time_bnds'].values, units,
-                                calendar=calendar_cycle1)
-
-
-    # cycle2 uses the same updated origin but also needs to have its values
-    # shifted nyears_cycle1 in the future
-    #ds2['time'] = cftime.num2date(ds2['time'].values + ndays_cycle1 + ndpy,
-    if calendar == 'leap':
-        ds2['time'] = cftime.num2date((ds2['time'].values + (nyears_cycle1+gap)*ndpy +
-                                       np.divmod(nyears_cycle1+gap, 4)[0].astype(float)),
-                                      units, calendar=calendar_cycle1)
-        tmp2_avgT1 = cftime.num2date((ds2['average_T1'].values + (nyears_cycle1+gap)*ndpy +
-                                      np.divmod(nyears_cycle1+gap, 4)[0].astype(float)),
-                                     units, calendar=calendar_cycle1)
-        tmp2_avgT2 = cftime.num2date((ds2['average_T2'].values + (nyears_cycle1+gap)*ndpy +
-                                      np.divmod(nyears_cycle1+gap, 4)[0].astype(float)),
-                                     units, calendar=calendar_cycle1)
-        tmp2_bnds = cftime.num2date((ds2['time_bnds'].values + (nyears_cycle1+gap)*ndpy +
-                                     np.divmod(nyears_cycle1+gap, 4)[0].astype(float)),
-                                    units, calendar=calendar_cycle1)
+    ds = merge_datasets([ds1, ds2], gaps=[gap], calendar=calendar)
+    return ds
 
-    else:
-        ds2['time'] = cftime.num2date(ds2['time'].values + (nyears_cycle1+gap)*ndpy,
-                                      units, calendar=calendar_cycle1)
-        tmp2_avgT1 = cftime.num2date(ds2['average_T1'].values + (nyears_cycle1+gap)*ndpy,
-                                      units, calendar=calendar_cycle1)
-        tmp2_avgT2 = cftime.num2date(ds2['average_T2'].values + (nyears_cycle1+gap)*ndpy,
-                                      units, calendar=calendar_cycle1)
-        tmp2_bnds = cftime.num2date(ds2['time_bnds'].values + (nyears_cycle1+gap)*ndpy,
-                                      units, calendar=calendar_cycle1)
-
-    # we can now concatenate the datasets
-    #print('concatenate')
-    #print(origin)
-    #print(ds1['time'].min(), ds1['time'].max())
-    #print(ds2['time'].min(), ds2['time'].max())
-    ds = xr.concat([ds1, ds2], dim='time', data_vars="minimal")
-    # finally re-encode the time variable (else get garbage in output netcdf)
-    timedata = cftime.date2num(ds['time'].values, units,
-                               calendar=calendar_cycle1)
-
-    tmp_avgT1 = np.concatenate((tmp1_avgT1, tmp2_avgT1), axis=0)
-    tmp_avgT2 = np.concatenate((tmp1_avgT2, tmp2_avgT2), axis=0)
-    tmp_bnds = np.concatenate((tmp1_bnds, tmp2_bnds), axis=0)
-
-    avg_T1 = cftime.date2num(tmp_avgT1, units,
-                               calendar=calendar_cycle1)
-    avg_T2 = cftime.date2num(tmp_avgT2, units,
-                               calendar=calendar_cycle1)
-    bnds = cftime.date2num(tmp_bnds, units,
-                           calendar=calendar_cycle1)
+
+def merge_datasets(list_of_datasets, gaps=None, calendar=None):
+    """ merge datasets of successive cycles into one long dataset
+
+    all cycle offsets are computed upfront from the time axes, the time
+    variables of each cycle are shifted once and all cycles are
+    concatenated in one go. Only the time coordinate is held in memory,
+    other variables stay lazy until the merged dataset is written.
+
+    gaps = list of gap year (e.g. 1) between cycles
+    calendar = override for the calendar of the time axis
+    """
+    with stage('merge', ncycles=len(list_of_datasets)):
+        spans = [cycle_span(ds) for ds in list_of_datasets]
+        offsets, units = compute_cycle_offsets(spans, gaps=gaps,
+                                               calendar=calendar)
+        ds = concat_cycles(list_of_datasets, offsets, units)
+    return ds
+
+
+def concat_cycles(list_of_datasets, offsets, units):
+    """ shift time variables of each cycle by its offset (in days) and
+    concatenate all cycles into a time axis with units units """
+    calendar_cycle1 = list_of_datasets[0]['time'].attrs['calendar']
+
+    # cycle1 values remains the same but the origin is shifted,
+    # next cycles use the same updated origin but also need to have their
+    # values shifted in the future
+    shifted = [shift_time_variables(ds, offset)
+               for ds, offset in zip(list_of_datasets, offsets)]
+
+    # we can now concatenate the datasets, variables without time dimension
+    # are taken from the first cycle without comparing (hence reading) them
+    ds = xr.concat(shifted, dim='time', data_vars="minimal",
+                   coords="minimal", compat="override")
+    ds1 = list_of_datasets[0]
 
     base_attrs = {'units': units, 'calendar': calendar_cycle1}
     avgT1_attrs = base_attrs.copy()
@@ -118,46 +73,67 @@ def merge_2_datasets(ds1, ds2, calendar='leap', gap=0):
     avgT2_attrs = base_attrs.copy()
     avgT2_attrs.update({"long_name": "End time for average period"})
 
-    ds['average_T1'] = xr.DataArray(data=avg_T1, attrs=avgT1_attrs, dims='time')
-    ds['average_T2'] = xr.DataArray(data=avg_T2, attrs=avgT2_attrs, dims='time')
+    ds['average_T1'] = xr.DataArray(data=ds['average_T1'].data, attrs=avgT1_attrs, dims='time')
+    ds['average_T2'] = xr.DataArray(data=ds['average_T2'].data, attrs=avgT2_attrs, dims='time')
 
-    ds["time_bnds"] = xr.DataArray(data=bnds, attrs=ds1["time_bnds"].attrs, dims=ds1["time_bnds"].dims)
+    ds["time_bnds"] = xr.DataArray(data=ds["time_bnds"].data, attrs=ds1["time_bnds"].attrs, dims=ds1["time_bnds"].dims)
     ds["time_bnds"].attrs.update({"long_name": "time axis boundaries"})
     ds["time_bnds"].attrs.update({"units": units})
     ds["time_bnds"].attrs.update({"calendar": calendar_cycle1})
     ds["time_bnds"].encoding.update({"_FillValue": -1})
 
-    if "nv" in list(ds.variables):
-        ds["nv"] = ds1["nv"].copy(deep=True)
-
     # this one has to be last
     # xarray tries to outsmart the attributes when bounds exists, will have to add it at the end
-    ds['time'] = xr.DataArray(data=timedata, attrs={'units': units, 'long_name': 'time',
-                                                    'cartesian_axis': 'T', 'calendar_type': calendar_cycle1,
-                                                    #'bounds': "time_bnds",
-                                                    'calendar': calendar_cycle1}, dims='time')
+    ds['time'] = xr.DataArray(data=ds['time'].values, attrs={'units': units, 'long_name': 'time',
+                                                             'cartesian_axis': 'T', 'calendar_type': calendar_cycle1,
+                                                             #'bounds': "time_bnds",
+                                                             'calendar': calendar_cycle1}, dims='time')
 
     return ds
 
 
-def merge_cycles(list_of_cycles, combine='by_coords', gaps=None):
-    """ recursively call merge_2_cycles
+def cycle_span(ds):
+    """ first and last time values, units and calendar of a cycle """
+    time = ds['time']
+    return (float(time[0].values), float(time[-1].values),
+            time.attrs['units'], time.attrs['calendar'])
+
+
+def shift_time_variables(ds, offset):
+    """ add offset to time, average_T1, average_T2 and time_bnds,
+    keeping dask-backed variables lazy """
+    if offset == 0:
+        return ds
+    shifted = ds.assign_coords(time=ds['time'] + offset)
+    for var in ['average_T1', 'average_T2', 'time_bnds']:
+        shifted[var] = ds[var].variable + offset
+    return shifted
+
+
+def merge_cycles(list_of_cycles, combine='by_coords', gaps=None,
+                 sel=None, isel=None, start_year=None, end_year=None,
+                 grid_cache=None):
+    """ merge all cycles into one dataset
 
     gaps = list of gap year (e.g. 1) between cycles
+    sel, isel = selections applied to each file when opened (see open_cycle)
+    grid_cache = optional cache of static variables (see open_cycle)
+    start_year, end_year = only keep these years of the merged time axis,
+                           files outside of this period are not opened
     """
-    if combine == 'nested':
-        kwargs = {'concat_dim': 'time'}
-    else:
-        kwargs = {}
-    kwargs.update({"coords": "minimal"})
-    kwargs.update({"data_vars": "minimal"})
-    kwargs.update({"compat": "override"})
-
     # loop from the end of list
     ncycles = len(list_of_cycles)
     if gaps is not None:
         assert len(gaps) == ncycles -1
 
+    if start_year is not None or end_year is not None:
+        # offsets only need the first and last file of each cycle
+        plan = build_merge_plan(list_of_cycles, gaps=gaps, read_all=False)
+        print(f'merge {ncycles} cycles with gap years {gaps} '
+              f'for years {start_year} to {end_year}')
+        return merge_from_plan(plan, start_year, end_year, combine=combine,
+                               sel=sel, isel=isel, grid_cache=grid_cache)
+
 #    # init to last cycle
 #    dsend = xr.open_mfdataset(list_of_cycles[-1], combine=combine,
 #                              decode_times=False, **kwargs)
@@ -167,19 +143,263 @@ def merge_cycles(list_of_cycles, combine='by_coords', gaps=None):
 #        # merge
 #        dsend = merge_2_datasets(dsstart, dsend)
 #
-    # init to the first cycle
-    dsstart = xr.open_mfdataset(list_of_cycles[0], combine=combine,
-                                decode_times=False, **kwargs)
-
-    for cycle in np.arange(1,ncycles):
-        dsend = xr.open_mfdataset(list_of_cycles[cycle], combine=combine,
-                                  decode_times=False, **kwargs)
-        # merge
-        if gaps is not None:
-            print(f'merge with cycle {cycle} of {ncycles} with {gaps[cycle-1]} gap year')
-            dsstart = merge_2_datasets(dsstart, dsend, gap=gaps[cycle-1])
+    datasets = [open_cycle(files, combine=combine, sel=sel, isel=isel,
+                           grid_cache=grid_cache)
+                for files in list_of_cycles]
+    print(f'merge {ncycles} cycles with gap years {gaps}')
+    ds = merge_datasets(datasets, gaps=gaps)
+
+    return ds
+
+
+def pipelined_merge_cycles(list_of_cycles, combine='by_coords', gaps=None,
+                           prefetch=1, recall=recall_files, sel=None,
+                           isel=None, grid_cache=None, **kwargs):
+    """ same as merge_cycles, but the files of the next cycles are
+    recalled from tape while the current cycle is opened and merged
+
+    sel, isel = selections applied to each file when opened (see open_cycle)
+    grid_cache = optional cache of static variables (see open_cycle)
+    prefetch = number of cycles recalled ahead of the one being merged
+    recall = function recalling a list of files and returning
+             {file: True if recalled}, kwargs are passed to it
+    """
+    ncycles = len(list_of_cycles)
+    if gaps is not None:
+        assert len(gaps) == ncycles -1
+
+    with ThreadPoolExecutor(max_workers=prefetch + 1) as pool:
+        recalls = [pool.submit(recall, files, **kwargs)
+                   for files in list_of_cycles[:prefetch + 1]]
+        datasets = []
+        for cycle in range(ncycles):
+            failed = [f for f, ok in recalls[cycle].result().items() if not ok]
+            if failed:
+                raise RuntimeError(f"could not recall {failed}")
+            # start recalling the next cycle before opening this one
+            nextcycle = cycle + prefetch + 1
+            if nextcycle < ncycles:
+                recalls.append(pool.submit(recall, list_of_cycles[nextcycle],
+                                           **kwargs))
+            datasets.append(open_cycle(list_of_cycles[cycle], combine=combine,
+                                       sel=sel, isel=isel,
+                                       grid_cache=grid_cache))
+
+    print(f'merge {ncycles} cycles with gap years {gaps}')
+    ds = merge_datasets(datasets, gaps=gaps)
+    return ds
+
+
+def merge_from_plan(plan, start_year=None, end_year=None,
+                    combine='by_coords', sel=None, isel=None,
+                    grid_cache=None):
+    """ merge cycles following a merge plan (see build_merge_plan),
+    only opening the files with data between start_year and end_year
+    (years of the merged time axis)
+
+    sel, isel = selections applied to each file when opened (see open_cycle)
+    grid_cache = optional cache of static variables (see open_cycle)
+    """
+    datasets = []
+    offsets = []
+    for files, cycle in zip(plan_files(plan, start_year, end_year),
+                            plan['cycles']):
+        if files:
+            datasets.append(open_cycle(files, combine=combine, sel=sel,
+                                       isel=isel, grid_cache=grid_cache))
+            offsets.append(cycle['offset'])
+    if not datasets:
+        raise ValueError(f"no files for years {start_year} to {end_year}, "
+                         f"merged cycles cover years "
+                         f"{plan['cycles'][0]['first_year']} to "
+                         f"{plan['cycles'][-1]['last_year']}")
+    ds = concat_cycles(datasets, offsets, plan['units'])
+    ds = select_years(ds, start_year, end_year, calendar=plan['calendar'])
+    return ds
+
+
+def stream_merge_cycles(list_of_cycles, nyears_file, gaps=None,
+                        windows=None, plan=None, cache=None,
+                        combine='by_coords', sel=None, isel=None,
+                        grid_cache=None):
+    """ merge cycles one output window at a time, yields
+    (start_year, end_year, merged dataset) for each window
+
+    each merged dataset only opens the files overlapping its window
+    (from the dates in filenames) so that the number of open files and
+    the size of the dask graph do not grow with the length of the run.
+
+    windows = list of (start_year, end_year), default from the plan
+    plan = merge plan, by default built reading only the first and last
+           file of each cycle (see build_merge_plan)
+    sel, isel = selections applied to each file when opened (see open_cycle)
+    grid_cache = optional cache of static variables (see open_cycle), the
+                 grid is then read once for all windows
+    """
+    if plan is None:
+        plan = build_merge_plan(list_of_cycles, gaps=gaps,
+                                nyears_file=nyears_file, cache=cache,
+                                read_all=False)
+    if windows is None:
+        windows = plan['windows']
+    for start_year, end_year in windows:
+        ds = merge_from_plan(plan, start_year, end_year, combine=combine,
+                             sel=sel, isel=isel, grid_cache=grid_cache)
+        yield start_year, end_year, ds
+
+
+def select_years(ds, start_year=None, end_year=None, calendar=None):
+    """ select time steps of ds between start_year and end_year (included)
+    without decoding the time axis """
+    if start_year is None and end_year is None:
+        return ds
+    if calendar is None:
+        calendar = ds['time'].attrs['calendar']
+    origin_year = origin_from_units(ds['time'].attrs['units']).year
+    time = ds['time'].values
+    keep = np.ones(time.shape, dtype=bool)
+    if start_year is not None:
+        keep &= time >= days_between_years(origin_year, start_year, calendar)
+    if end_year is not None:
+        keep &= time < days_between_years(origin_year, end_year + 1, calendar)
+    return ds.isel(time=np.flatnonzero(keep))
+
+
+def open_cycle(files, combine='by_coords', sel=None, isel=None,
+               grid_cache=None):
+    """ open all files of a cycle into a single dataset,
+    without decoding times
+
+    sel, isel = dictionaries of selections (as in Dataset.sel and
+                Dataset.isel, e.g. {'yh': slice(-30, 30)}) applied to
+                each file before files are combined, isel first. Time
+                can not be selected here, use years in merge functions.
+    grid_cache = optional dictionary of static variables (variables
+                 without time, e.g. xh, yh, nv, geolon), shared by the
+                 fields of a stream, see open_with_grid_cache
+    """
+    if combine == 'nested':
+        kwargs = {'concat_dim': 'time'}
+    else:
+        kwargs = {}
+    kwargs.update({"coords": "minimal"})
+    kwargs.update({"data_vars": "minimal"})
+    kwargs.update({"compat": "override"})
+    for selection in [sel, isel]:
+        if selection and 'time' in selection:
+            raise ValueError("time can not be selected in each file, "
+                             "use start_year and end_year")
+    if grid_cache is not None:
+        return open_with_grid_cache(files, grid_cache, combine=combine,
+                                    sel=sel, isel=isel, **kwargs)
+    if sel or isel:
+        kwargs.update({"preprocess": partial(subset_dataset, sel=sel,
+                                             isel=isel)})
+    with stage('open_cycle', nfiles=len(files)):
+        ds = xr.open_mfdataset(files, combine=combine, decode_times=False,
+                               **kwargs)
+    return ds
+
+
+def open_with_grid_cache(files, grid_cache, combine='by_coords', sel=None,
+                         isel=None, **kwargs):
+    """ open files of a cycle for their time varying variables only,
+    static variables are read once and kept in grid_cache
+
+    static variables are the same in all files of a stream, but
+    open_mfdataset reads, indexes and compares them for each file. Here
+    the grid is read from the first file only, the header of each file is
+    checked against its fingerprint (names, dimensions, shapes and types of
+    static variables) and static variables are dropped when files are
+    opened. The cached variables are then attached to the combined dataset
+    without copying them, so all cycles and windows merged with the same
+    cache share them. Grids are cached by fingerprint of the first file
+    and selections, so fields on different grids (e.g. xh/yh and xq/yh)
+    can share the cache.
+    """
+    cached = None
+    if combine == 'nested':
+        combine_datasets = xr.combine_nested
+    else:
+        combine_datasets = xr.combine_by_coords
+    datasets = []
+    with stage('open_cycle', nfiles=len(files), grid_cache=True):
+        for f in files:
+            # the file is opened once, for its header and its variables
+            store = xr.backends.NetCDF4DataStore.open(f)
+            fingerprint = grid_fingerprint(store.ds)
+            if cached is None:
+                key = (fingerprint, repr((sel, isel)))
+                if key not in grid_cache:
+                    grid_cache[key] = read_grid(f, sel=sel, isel=isel)
+                cached = grid_cache[key]
+            if fingerprint != cached['fingerprint']:
+                store.close()
+                for ds in datasets:
+                    ds.close()
+                raise ValueError(f"grid of {f} differs from the cached grid")
+            ds = xr.open_dataset(store, decode_times=False, chunks={},
+                                 drop_variables=cached['static'])
+            # static coordinates are dropped, files can only be indexed
+            datasets.append(subset_dataset(ds, isel=cached['isel']))
+        # attributes of the first file, as in open_mfdataset
+        ds = combine_datasets(datasets, combine_attrs="override", **kwargs)
+    ds.set_close(partial(_close_datasets, datasets))
+    grid = cached['grid']
+    ds = ds.assign_coords({name: grid[name].variable for name in grid.coords})
+    ds = ds.assign({name: grid[name].variable for name in grid.data_vars})
+    return ds
+
+
+def read_grid(path, sel=None, isel=None):
+    """ static variables of file path after selections, in a dictionary
+    {'fingerprint', 'static': names of static variables, 'grid': dataset,
+     'isel': index selection giving the same subset in files opened
+             without static variables}
+    """
+    store = xr.backends.NetCDF4DataStore.open(path)
+    fingerprint = grid_fingerprint(store.ds)
+    static = [name for name, *_ in fingerprint]
+    with xr.open_dataset(store, decode_times=False) as ds:
+        grid = ds[static].load()
+    # position of each point along each dimension, to turn label
+    # selections into index selections
+    positions = {f'position_{dim}': (dim, np.arange(size))
+                 for dim, size in grid.sizes.items()}
+    subset = subset_dataset(grid.assign(positions), sel=sel, isel=isel)
+    indexers = {}
+    for dim in set(sel or {}) | set(isel or {}):
+        index = subset[f'position_{dim}'].values
+        if index.ndim == 0:
+            indexers[dim] = int(index)
+        elif len(index) > 0 and np.all(np.diff(index) == 1):
+            indexers[dim] = slice(int(index[0]), int(index[-1]) + 1)
         else:
-            print(f'merge with cycle {cycle} of {ncycles}')
-            dsstart = merge_2_datasets(dsstart, dsend)
+            indexers[dim] = index
+    return {'fingerprint': fingerprint, 'static': static,
+            'grid': subset.drop_vars(list(positions)), 'isel': indexers}
+
+
+def grid_fingerprint(nc_file):
+    """ names, dimensions, shapes and types of the variables without time
+    dimension of an open netCDF4 Dataset, from its header """
+    return tuple(sorted((name, var.dimensions, var.shape,
+                         np.dtype(var.dtype).str)
+                        for name, var in nc_file.variables.items()
+                        if 'time' not in var.dimensions))
+
+
+def _close_datasets(datasets):
+    """ close all datasets combined by open_with_grid_cache """
+    for ds in datasets:
+        ds.close()
+
+
+def subset_dataset(ds, sel=None, isel=None):
+    """ apply index (isel) then label (sel) selections to ds """
+    if isel:
+        ds = ds.isel(isel)
+    if sel:
+        ds = ds.sel(sel)
+    return ds
 
-    return dsstart
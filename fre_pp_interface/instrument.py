@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Opt-in instrumentation of the stages of a post-processing job (file
+# discovery, recall, opening, merging, writing). Nothing is recorded until
+# enable_instrumentation is called. Each stage produces a record:
+# {'name', 'start', 'wall_time', 'nfiles', 'bytes_read', 'bytes_written',
+#  'peak_memory', 'thread', ...extra information given by the stage}
+# bytes are counted for the whole process (/proc/self/io), so they include
+# the work of other threads running at the same time. peak_memory is the
+# maximum resident size of the process during the stage, in bytes: the
+# high water mark of the process is reset when a stage starts (None if
+# it can not be reset, e.g. outside of linux).
+
+_instrumentation = {'enabled': False, 'callback': None, 'records': [],
+                    'running': []}
+_records_lock = threading.Lock()
+
+
+def enable_instrumentation(callback=None):
+    """ start recording stages
+
+    callback = optional callable callback(record) called at the end of
+               each stage, records are also kept for instrumentation_report
+    """
+    _instrumentation.update({'enabled': True, 'callback': callback})
+
+
+def disable_instrumentation():
+    """ stop recording stages, records are kept """
+    _instrumentation.update({'enabled': False, 'callback': None})
+
+
+def clear_instrumentation():
+    """ forget all records """
+    with _records_lock:
+        _instrumentation['records'] = []
+
+
+def instrumentation_report(path=None):
+    """ report of all records with totals for each stage name, saved
+    as json into file path if given """
+    with _records_lock:
+        records = list(_instrumentation['records'])
+    summary = {}
+    for record in records:
+        total = summary.setdefault(record['name'],
+                                   {'count': 0, 'wall_time': 0., 'nfiles': 0,
+                                    'bytes_read': 0, 'bytes_written': 0,
+                                    'peak_memory': 0})
+        total['count'] += 1
+        for key in ['wall_time', 'nfiles', 'bytes_read', 'bytes_written']:
+            total[key] += record[key] or 0
+        total['peak_memory'] = max(total['peak_memory'],
+                                   record['peak_memory'] or 0)
+    report = {'stages': records, 'summary': summary}
+    if path is not None:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=1)
+    return report
+
+
+@contextmanager
+def stage(name, nfiles=None, **info):
+    """ context manager recording wall time, number of files, bytes read
+    and written and peak memory of the code it wraps. It yields the record
+    so that the number of files (or other information) can be set once
+    known. Does nothing unless instrumentation is enabled. """
+    if not _instrumentation['enabled']:
+        yield {}
+        return
+    record = {'name': name, 'nfiles': nfiles}
+    record.update(info)
+    # stages already running (nested or in other threads) keep the peak
+    # reached so far before the high water mark is reset
+    with _records_lock:
+        for running in _instrumentation['running']:
+            running['peak_memory'] = _max_memory(running['peak_memory'],
+                                                 _peak_memory())
+        record['peak_memory'] = 0 if _reset_peak_memory() else None
+        _instrumentation['running'].append(record)
+    io_start = _process_io()
+    start = time.time()
+    tic = time.perf_counter()
+    try:
+        yield record
+    finally:
+        wall_time = time.perf_counter() - tic
+        io_end = _process_io()
+        with _records_lock:
+            _instrumentation['running'].remove(record)
+            peak_memory = None
+            if record['peak_memory'] is not None:
+                peak_memory = _max_memory(record['peak_memory'],
+                                          _peak_memory())
+        record.update({'start': start,
+                       'wall_time': wall_time,
+                       'bytes_read': None,
+                       'bytes_written': None,
+                       'peak_memory': peak_memory,
+                       'thread': threading.current_thread().name})
+        if io_start is not None and io_end is not None:
+            record['bytes_read'] = io_end['rchar'] - io_start['rchar']
+            record['bytes_written'] = io_end['wchar'] - io_start['wchar']
+        with _records_lock:
+            _instrumentation['records'].append(record)
+        callback = _instrumentation['callback']
+        if callback is not None:
+            callback(record)
+
+
+def _process_io():
+    """ i/o counters of the process, None if not available """
+    try:
+        with open('/proc/self/io') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    counters = {}
+    for line in lines:
+        key, _, value = line.partition(':')
+        counters[key] = int(value)
+    return counters
+
+
+def _reset_peak_memory():
+    """ reset the high water mark of the resident set size of the process,
+    returns False if not possible """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def _peak_memory():
+    """ maximum resident set size of the process in bytes since the last
+    reset, None if not available """
+    try:
+        with open('/proc/self/status') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    for line in lines:
+        if line.startswith('VmHWM:'):
+            # in kilobytes
+            return int(line.split()[1]) * 1024
+    return None
+
+
+def _max_memory(peak, other):
+    """ maximum of two peaks, None if one of them is not known """
+    if peak is None or other is None:
+        return None
+    return max(peak, other)
@@ -0,0 +1,221 @@
+import json
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import netCDF4 as nc
+from .calendars import (check_calendar, compute_cycle_offsets,
+                        days_per_year, origin_from_units, year_of_day)
+from .instrument import stage
+from .timeserie_interface import get_dates_from_filename
+
+# A merge plan describes how cycles are merged without opening them as
+# datasets: it only needs the time variables of each file. It is a plain
+# dictionary that can be saved as json:
+# {'calendar': ..., 'units': units of merged time axis, 'gaps': [...],
+#  'nyears_file': ..., 'windows': [[start_year, end_year], ...],
+#  'cycles': [{'units', 'calendar', 'first', 'last', 'ntime', 'offset',
+#              'nyears', 'first_year', 'last_year', 'year_shift',
+#              'files': [{'path', 'size', 'mtime', 'units', 'calendar',
+#                         'ntime', 'first', 'last'}, ...]}, ...]}
+# files that were not read only have a path.
+
+# below this number of files to read, headers are read in the calling
+# process: starting a pool costs more than reading a few headers
+POOL_MIN_FILES = 32
+
+
+def build_merge_plan(list_of_cycles, gaps=None, calendar=None,
+                     nyears_file=None, cache=None, nworkers=8,
+                     read_all=True):
+    """ read the time axis of every file in every cycle (in parallel)
+    and compute offsets and output files boundaries to merge them
+
+    gaps = list of gap year (e.g. 1) between cycles
+    calendar = override for the calendar of the time axis
+    nyears_file = number of years in output files, to compute windows
+    cache = json file where the plan is saved, files that did not change
+            since the plan was saved are not read again
+    read_all = if False, only read the first and last file of each cycle,
+               which is all that is needed to compute offsets
+    nworkers = number of processes reading headers. Headers are read in
+               the calling process if nworkers <= 1, if read_all is False
+               or if there are less than POOL_MIN_FILES files to read, so
+               that plans can be built in daemonic processes (e.g. dask
+               workers). The pool uses spawn, never forking a process
+               that already runs threads.
+    """
+    cached = {}
+    if cache is not None and os.path.exists(cache):
+        for cycle in load_plan(cache)['cycles']:
+            for header in cycle['files']:
+                cached[header['path']] = header
+
+    headers = {}
+    toread = []
+    for files in list_of_cycles:
+        for k, f in enumerate(files):
+            if not read_all and 0 < k < len(files) - 1:
+                headers[f] = {'path': f}
+                continue
+            st = os.stat(f)
+            header = cached.get(f)
+            if (header is not None and header.get('size') == st.st_size and
+                    header.get('mtime') == st.st_mtime):
+                headers[f] = header
+            else:
+                toread.append(f)
+    toread = list(dict.fromkeys(toread))
+    if toread:
+        with stage('read_headers', nfiles=len(toread),
+                   ncached=len(headers)):
+            if nworkers <= 1 or not read_all or len(toread) < POOL_MIN_FILES:
+                for f in toread:
+                    headers[f] = read_time_header(f)
+            else:
+                context = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(max_workers=nworkers,
+                                         mp_context=context) as pool:
+                    for header in pool.map(read_time_header, toread):
+                        headers[header['path']] = header
+
+    plan = make_merge_plan([[headers[f] for f in files]
+                            for files in list_of_cycles],
+                           gaps=gaps, calendar=calendar,
+                           nyears_file=nyears_file)
+    if cache is not None:
+        save_plan(plan, cache)
+    return plan
+
+
+def make_merge_plan(list_of_headers, gaps=None, calendar=None,
+                    nyears_file=None):
+    """ build merge plan from the time headers (see read_time_header)
+    of the files of each cycle """
+    spans = []
+    for headers in list_of_headers:
+        spans.append((headers[0]['first'], headers[-1]['last'],
+                      headers[0]['units'], headers[0]['calendar']))
+    offsets, units = compute_cycle_offsets(spans, gaps=gaps,
+                                           calendar=calendar)
+    if calendar is None:
+        calendar = spans[0][3]
+    calendar = check_calendar(calendar)
+    ndpy = days_per_year(calendar)
+    origin_year = origin_from_units(units).year
+
+    cycles = []
+    for headers, span, offset in zip(list_of_headers, spans, offsets):
+        first, last, cycle_units, cycle_calendar = span
+        ntime = None
+        if all('ntime' in header for header in headers):
+            ntime = sum(header['ntime'] for header in headers)
+        first_year = year_of_day(first + offset, origin_year, calendar)
+        # years to add to dates of the cycle to get merged time axis dates
+        year_shift = first_year - year_of_day(
+            first, origin_from_units(cycle_units).year, calendar)
+        cycles.append({'units': cycle_units,
+                       'calendar': cycle_calendar,
+                       'first': first,
+                       'last': last,
+                       'ntime': ntime,
+                       'offset': offset,
+                       'nyears': int(math.floor((last - first)/ndpy + 1)),
+                       'first_year': first_year,
+                       'last_year': year_of_day(last + offset, origin_year,
+                                                calendar),
+                       'year_shift': year_shift,
+                       'files': headers})
+
+    plan = {'calendar': calendar,
+            'units': units,
+            'gaps': gaps,
+            'nyears_file': nyears_file,
+            'cycles': cycles,
+            'windows': None}
+    if nyears_file is not None:
+        plan['windows'] = output_windows([cycle['first_year'] for cycle in cycles],
+                                         [cycle['nyears'] for cycle in cycles],
+                                         nyears_file)
+    return plan
+
+
+def read_time_header(path):
+    """ read time axis information of file path without reading
+    any other variable """
+    with nc.Dataset(path) as f:
+        time = f.variables['time']
+        header = {'path': path,
+                  'units': time.units,
+                  'calendar': getattr(time, 'calendar', 'standard'),
+                  'ntime': len(time),
+                  'first': float(time[0]),
+                  'last': float(time[-1])}
+    st = os.stat(path)
+    header.update({'size': st.st_size, 'mtime': st.st_mtime})
+    return header
+
+
+def output_windows(first_years, nyears_cycles, nyears_file):
+    """ start and end years of output files containing nyears_file years,
+    output files do not span several cycles so the last file of a cycle
+    includes the extra years, if any
+
+    first_years = first year of each cycle on the merged time axis
+    nyears_cycles = number of years in each cycle
+    """
+    windows = []
+    for first_year, nyears in zip(first_years, nyears_cycles):
+        # find out how many years are left to add in the last file
+        extra_years = nyears % nyears_file
+        # this is how many files to create for this cycle
+        nfiles = max((nyears - extra_years) // nyears_file, 1)
+        startyear = first_year
+        for nf in range(nfiles):
+            endyear = startyear + nyears_file - 1
+            if nf == nfiles - 1:  # last file has extra years, if any
+                endyear = first_year + nyears - 1
+            windows.append([startyear, endyear])
+            startyear = endyear + 1
+    return windows
+
+
+def plan_files(plan, start_year=None, end_year=None):
+    """ files of each cycle with data between start_year and end_year
+    (on the merged time axis), based on the dates in filenames
+
+    in calendars with leap years, shifting a cycle by a number of days
+    moves the first or last days of files into the next or previous
+    year, so files of the years next to the period are also included
+    """
+    margin = 0
+    if days_per_year(plan['calendar']) not in [360., 365., 366.]:
+        margin = 1
+    list_of_cycles = []
+    for cycle in plan['cycles']:
+        files = []
+        for header in cycle['files']:
+            fname = header['path'].rpartition('/')[2]
+            start, end = get_dates_from_filename(fname)
+            if (start_year is not None and
+                    end.year + cycle['year_shift'] < start_year - margin):
+                continue
+            if (end_year is not None and
+                    start.year + cycle['year_shift'] > end_year + margin):
+                continue
+            files.append(header['path'])
+        list_of_cycles.append(files)
+    return list_of_cycles
+
+
+def save_plan(plan, path):
+    """ save merge plan into json file """
+    with open(path, 'w') as f:
+        json.dump(plan, f, indent=1)
+
+
+def load_plan(path):
+    """ load merge plan from json file """
+    with open(path) as f:
+        plan = json.load(f)
+    return plan
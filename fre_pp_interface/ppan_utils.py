@@ -1,32 +1,220 @@
-import pandas as pd
+import os
 import subprocess as sp
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .instrument import stage
 
 # Utils for GFDL PP/AN machine
 
+# command used to recall files from tape, directory and file names
+# are appended as: dmget -v -d <directory> <file1> <file2> ...
+DMGET_CMD = ('dmget', '-v')
+# command listing files with their DMF state, as in:
+# -rw-r--r-- 1 user group 123456 2019-08-08 12:00 (DUL) filename
+DMLS_CMD = ('dmls', '-l')
+# DMF states for which the data is on disk
+ONLINE_STATES = ('REG', 'DUL', 'MIG')
 
-def optim_dmget(files):
-    """ create a dataframe of all files and directories
-    then call dmget on all directories for matching files """
-    data = []
-    for f in files:
-        fname = f.replace('/', ' ').split()[-1]
-        fdir = f.rstrip(fname)
-        data.append([fdir, fname])
-    # create dataframe
-    df = pd.DataFrame(data, columns=['directory', 'file'])
-    alldirs = list(set(df['directory']))
-    for thisdir in alldirs:
-        match = df.where(df['directory'] == thisdir)['file'].dropna(how='all')
-        files = list(match)
-        check = run_dmget(thisdir, files)
-        if check != 0:
-            print(check)
-    return None
-
-
-def run_dmget(rep, files):
+# residency answers: {file: (online, time of query)}
+_residency_cache = {}
+
+
+def optim_dmget(files, **kwargs):
+    """ group files by directory then call dmget on all directories
+    for matching files, see recall_files for kwargs """
+    return recall_files(files, **kwargs)
+
+
+def run_dmget(rep, files, dmget_cmd=DMGET_CMD):
     """ get files from directory rep """
-    cmd = ['dmget', '-v', '-d', rep] + files
-    cmd_str = " ".join(x for x in cmd)
-    check = sp.check_call(cmd_str, shell=True)
+    cmd = list(dmget_cmd) + ['-d', rep] + files
+    check = sp.check_call(cmd)
     return check
+
+
+def recall_files(files, max_files=500, max_bytes=None, nworkers=4,
+                 retries=2, retry_wait=10., dmget_cmd=DMGET_CMD,
+                 progress=None, skip_online=False, **kwargs):
+    """ recall files from tape, running batches of files from the same
+    directory concurrently
+
+    max_files = maximum number of files per dmget call
+    max_bytes = maximum size of files per dmget call
+    nworkers = number of dmget calls running at the same time
+    retries = number of times a failed batch is retried
+    retry_wait = seconds to wait before retrying, doubled each retry
+    dmget_cmd = command (sequence) used to recall files
+    progress = optional callable progress(nfiles_done, nfiles_total)
+    skip_online = only recall files that are not already on disk,
+                  kwargs are passed to query_residency
+
+    returns a dictionary {file: True if recalled, False otherwise}
+    """
+    result = {}
+    if skip_online:
+        residency = query_residency(files, nworkers=nworkers, **kwargs)
+        files = [f for f, online in residency.items() if not online]
+        result.update({f: True for f, online in residency.items() if online})
+    groups = group_by_directory(dict.fromkeys(files))
+    batches = make_batches(groups, max_files=max_files, max_bytes=max_bytes)
+    ntotal = len(result) + sum(len(batch) for _, batch in batches)
+    with stage('recall', nfiles=ntotal - len(result),
+               nbatches=len(batches)) as record:
+        with ThreadPoolExecutor(max_workers=nworkers) as pool:
+            futures = [pool.submit(_recall_batch, rep, batch, dmget_cmd,
+                                   retries, retry_wait)
+                       for rep, batch in batches]
+            for future in as_completed(futures):
+                recalled = future.result()
+                result.update(recalled)
+                _update_residency_cache(f for f, ok in recalled.items() if ok)
+                if progress is not None:
+                    progress(len(result), ntotal)
+        record['nfailed'] = sum(1 for ok in result.values() if not ok)
+    return result
+
+
+def offline_files(files, **kwargs):
+    """ return the files that are not on disk, see query_residency """
+    residency = query_residency(files, **kwargs)
+    return [f for f, online in residency.items() if not online]
+
+
+def query_residency(files, backend=None, ttl=300., nworkers=4,
+                    max_files=500):
+    """ find out which files are on disk (online) and which are only on
+    tape (offline). Answers are cached for ttl seconds.
+
+    backend = callable backend(directory, files) returning
+              {file: online} for files of one directory, defaults to
+              dmls_residency
+    nworkers = number of backend calls running at the same time
+    max_files = maximum number of files per backend call
+
+    returns a dictionary {file: True if online, False otherwise}
+    """
+    if backend is None:
+        backend = dmls_residency
+    now = time.monotonic()
+    result = {}
+    todo = []
+    for f in dict.fromkeys(files):
+        cached = _residency_cache.get(f)
+        if cached is not None and now - cached[1] < ttl:
+            result[f] = cached[0]
+        else:
+            todo.append(f)
+    batches = make_batches(group_by_directory(todo), max_files=max_files)
+    with stage('residency', nfiles=len(todo), ncached=len(result)):
+        with ThreadPoolExecutor(max_workers=nworkers) as pool:
+            futures = [pool.submit(backend, rep, batch)
+                       for rep, batch in batches]
+            for future in as_completed(futures):
+                for f, online in future.result().items():
+                    result[f] = online
+                    _residency_cache[f] = (online, now)
+    return result
+
+
+def clear_residency_cache():
+    """ forget all cached residency answers """
+    _residency_cache.clear()
+
+
+def dmls_residency(rep, files, dmls_cmd=DMLS_CMD):
+    """ residency backend parsing the output of dmls -l for files in
+    directory rep. Files missing from the output are considered offline """
+    names = {f.rpartition('/')[2]: f for f in files}
+    residency = {f: False for f in files}
+    cmd = list(dmls_cmd) + list(names)
+    try:
+        proc = sp.run(cmd, cwd=rep, stdout=sp.PIPE, stderr=sp.DEVNULL,
+                      text=True)
+    except OSError:
+        return residency
+    for line in proc.stdout.splitlines():
+        elements = line.split()
+        if len(elements) < 2:
+            continue
+        name = elements[-1]
+        state = elements[-2].strip('()')
+        if name in names:
+            residency[names[name]] = state in ONLINE_STATES
+    return residency
+
+
+def local_residency(rep, files):
+    """ residency backend for filesystems without tape storage:
+    every existing file is online """
+    return {f: os.path.exists(f) for f in files}
+
+
+def _update_residency_cache(files):
+    """ mark files as online in the residency cache """
+    now = time.monotonic()
+    for f in files:
+        _residency_cache[f] = (True, now)
+
+
+def group_by_directory(files):
+    """ group files by directory, returns {directory: [files]} """
+    groups = {}
+    for f in files:
+        rep = f.rpartition('/')[0] or '.'
+        groups.setdefault(rep, []).append(f)
+    return groups
+
+
+def make_batches(groups, max_files=500, max_bytes=None):
+    """ split groups of files into batches of at most max_files files
+    and max_bytes bytes, returns a list of (directory, [files]) """
+    batches = []
+    for rep, files in groups.items():
+        batch = []
+        nbytes = 0
+        for f in files:
+            fbytes = _file_size(f) if max_bytes is not None else 0
+            full = (len(batch) == max_files) or \
+                   (max_bytes is not None and nbytes + fbytes > max_bytes)
+            if batch and full:
+                batches.append((rep, batch))
+                batch = []
+                nbytes = 0
+            batch.append(f)
+            nbytes += fbytes
+        if batch:
+            batches.append((rep, batch))
+    return batches
+
+
+def _file_size(f):
+    """ size of file f, 0 if it cannot be found """
+    try:
+        return os.stat(f).st_size
+    except OSError:
+        return 0
+
+
+def _call_dmget(rep, files, dmget_cmd):
+    """ run dmget on files in directory rep, return True on success """
+    cmd = list(dmget_cmd) + ['-d', rep] + [f.rpartition('/')[2] for f in files]
+    try:
+        proc = sp.run(cmd, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+    except OSError:
+        return False
+    return proc.returncode == 0
+
+
+def _recall_batch(rep, files, dmget_cmd, retries, retry_wait):
+    """ recall a batch of files, with retries. If the batch keeps failing
+    recall files one by one to find out which ones cannot be recalled """
+    wait = retry_wait
+    for attempt in range(retries + 1):
+        if _call_dmget(rep, files, dmget_cmd):
+            return {f: True for f in files}
+        if attempt < retries:
+            time.sleep(wait)
+            wait *= 2
+    if len(files) == 1:
+        return {files[0]: False}
+    return {f: _call_dmget(rep, [f], dmget_cmd) for f in files}
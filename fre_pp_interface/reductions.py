@@ -0,0 +1,219 @@
+import numpy as np
+import xarray as xr
+from .calendars import (check_calendar, days_between_years, days_in_year,
+                        origin_from_units, years_of_days)
+from .cycles import stream_merge_cycles
+from .plan import build_merge_plan
+
+# Reductions computed in one pass over the windows of merged cycles (see
+# stream_merge_cycles), holding one window in memory at a time:
+# - annual means, weighted by the length of averaging periods
+#   (average_T2 - average_T1)
+# - climatology of each cycle: weighted mean of each time step of the
+#   year (month for monthly data, day for daily data) over the cycle.
+#   Steps are keyed by calendar date: in leap years, February 29th is
+#   averaged with February 28th so that later days match other years
+# - anomalies of annual means from the mean of their cycle
+# The state of reductions is a dictionary updated by reduce_windows.
+
+# time variables that are not reduced as data
+TIME_VARIABLES = ('average_T1', 'average_T2', 'average_DT', 'time_bnds')
+
+# first day of each month (from 0) in years without and with leap day
+MONTH_STARTS = np.cumsum([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+LEAP_MONTH_STARTS = MONTH_STARTS + (np.arange(12) >= 2)
+
+
+def stream_reductions(list_of_cycles, nyears_file, gaps=None, plan=None,
+                      variables=None, combine='by_coords'):
+    """ annual means, cycle climatologies and annual anomalies of merged
+    cycles in a single pass, see reduction_results """
+    if plan is None:
+        plan = build_merge_plan(list_of_cycles, gaps=gaps,
+                                nyears_file=nyears_file, read_all=False)
+    reductions = new_reductions(plan, variables=variables)
+    for _ in reduce_windows(stream_merge_cycles(list_of_cycles, nyears_file,
+                                                plan=plan, combine=combine),
+                            reductions):
+        pass
+    return reduction_results(reductions)
+
+
+def new_reductions(plan, variables=None):
+    """ empty state of reductions for merged cycles of merge plan
+
+    variables = variables to reduce, default all variables along time
+    """
+    return {'units': plan['units'],
+            'calendar': plan['calendar'],
+            'cycle_years': [(cycle['first_year'], cycle['last_year'])
+                            for cycle in plan['cycles']],
+            'variables': variables,
+            'template': None,
+            'years': [],
+            'annual': {},
+            'climatology': {}}
+
+
+def reduce_windows(merged_windows, reductions):
+    """ update reductions with each (start_year, end_year, dataset) of
+    merged_windows and yield it again, loaded in memory, so that it can
+    also be written without being read twice, e.g.
+    write_merged_windows(reduce_windows(windows, reductions), ...) """
+    for start_year, end_year, ds in merged_windows:
+        ds = ds.load()
+        update_reductions(reductions, start_year, ds)
+        yield start_year, end_year, ds
+
+
+def update_reductions(reductions, start_year, ds):
+    """ add the time steps of window ds starting on start_year to
+    reductions """
+    if reductions['variables'] is None:
+        reductions['variables'] = [var for var in ds.data_vars
+                                   if 'time' in ds[var].dims and
+                                   var not in TIME_VARIABLES]
+    if reductions['template'] is None:
+        # attributes and coordinates of variables, without time
+        reductions['template'] = ds[reductions['variables']].isel(time=0,
+                                                                  drop=True)
+    cycle = [k for k, (first, last) in enumerate(reductions['cycle_years'])
+             if first <= start_year <= last][0]
+
+    t1 = ds['average_T1'].values
+    t2 = ds['average_T2'].values
+    weights = t2 - t1
+    origin_year = origin_from_units(reductions['units']).year
+    years = years_of_days(ds['time'].values, origin_year,
+                          reductions['calendar'])
+
+    climatology = reductions['climatology'].setdefault(cycle, {})
+    for year in np.unique(years):
+        steps = np.flatnonzero(years == year)
+        reductions['years'].append((int(year), cycle, float(t1[steps[0]]),
+                                    float(t2[steps[-1]])))
+        slots = steps_of_year(ds['time'].values[steps], int(year),
+                              origin_year, reductions['calendar'],
+                              np.median(weights))
+        for var in reductions['variables']:
+            data = ds[var].transpose('time', ...).values[steps]
+            num, den = _weighted_sums(data, weights[steps])
+            reductions['annual'].setdefault(var, []).append(num / den)
+            # climatology: sums for each time step of the year
+            sums = climatology.get(var)
+            if sums is None or len(sums[0]) <= slots.max():
+                sums = _grow_sums(sums, slots.max() + 1, data.shape[1:])
+            valid = ~np.isnan(data)
+            stepweights = _expand(weights[steps], data)
+            # slots repeat when February 29th joins February 28th
+            np.add.at(sums[0], slots, np.where(valid, data * stepweights, 0.))
+            np.add.at(sums[1], slots, np.where(valid, stepweights, 0.))
+            climatology[var] = sums
+    return reductions
+
+
+def steps_of_year(days, year, origin_year, calendar, step_length):
+    """ index in the year of time steps of year, given as days since
+    January 1st of origin_year and step_length days apart: month (0-11)
+    for monthly data, else number of the step in a year without leap
+    day, February 29th being the same step as February 28th """
+    calendar = check_calendar(calendar)
+    day = np.asarray(days, dtype=float) - days_between_years(origin_year,
+                                                             year, calendar)
+    if step_length >= 360:
+        return np.zeros(day.shape, dtype=int)
+    if calendar == '360_day':
+        if step_length >= 28:
+            return (day // 30).astype(int)
+        return (day // step_length).astype(int)
+    leap = days_in_year(year, calendar) == 366
+    if step_length >= 28:
+        starts = LEAP_MONTH_STARTS if leap else MONTH_STARTS
+        return np.searchsorted(starts, day, side='right') - 1
+    if leap and calendar not in ['all_leap', '366_day']:
+        # February 29th starts on day 59
+        day = np.where(day >= 59, day - 1, day)
+    return (day // step_length).astype(int)
+
+
+def reduction_results(reductions):
+    """ datasets of reductions:
+    {'annual_means': dataset along time (one step per year),
+     'climatology': dataset along cycle and step of the year,
+     'anomalies': annual means minus the mean of their cycle}
+    """
+    template = reductions['template']
+    units = reductions['units']
+    calendar = reductions['calendar']
+    years = reductions['years']
+    t1 = np.array([year[2] for year in years])
+    t2 = np.array([year[3] for year in years])
+    cycles = np.array([year[1] for year in years])
+    time_attrs = {'units': units, 'calendar': calendar}
+
+    annual = xr.Dataset(
+        coords={'time': ('time', (t1 + t2) / 2.,
+                         {'units': units, 'long_name': 'time',
+                          'cartesian_axis': 'T', 'calendar_type': calendar,
+                          'calendar': calendar})})
+    annual['average_T1'] = ('time', t1, dict(time_attrs, long_name='Start time for average period'))
+    annual['average_T2'] = ('time', t2, dict(time_attrs, long_name='End time for average period'))
+    annual['average_DT'] = ('time', t2 - t1, {'units': 'days', 'long_name': 'Length of average period'})
+    annual['time_bnds'] = (('time', 'nv'), np.stack([t1, t2], axis=1),
+                           dict(time_attrs, long_name='time axis boundaries'))
+    anomalies = annual.copy()
+    climatology = xr.Dataset(coords={'cycle': np.arange(1, len(reductions['cycle_years']) + 1)})
+
+    for var in reductions['variables']:
+        dims = ('time',) + template[var].dims
+        dtype = template[var].dtype
+        values = np.stack(reductions['annual'][var])
+        annual[var] = (dims, values.astype(dtype), template[var].attrs)
+        # anomalies from the mean of annual means of each cycle
+        anomaly = np.empty_like(values)
+        for cycle in np.unique(cycles):
+            steps = np.flatnonzero(cycles == cycle)
+            num, den = _weighted_sums(values[steps], t2[steps] - t1[steps])
+            anomaly[steps] = values[steps] - num / den
+        anomalies[var] = (dims, anomaly.astype(dtype), template[var].attrs)
+
+        nsteps = max(len(sums[var][0]) for sums in reductions['climatology'].values())
+        clim = np.full((len(climatology['cycle']), nsteps) + template[var].shape, np.nan)
+        for cycle, sums in reductions['climatology'].items():
+            num, den = sums[var]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                clim[cycle, :len(num)] = np.where(den > 0, num / den, np.nan)
+        climatology[var] = (('cycle', 'step') + template[var].dims,
+                            clim.astype(dtype), template[var].attrs)
+
+    for ds in [annual, anomalies, climatology]:
+        ds.coords.update({name: coord for name, coord in template.coords.items()})
+    return {'annual_means': annual, 'climatology': climatology,
+            'anomalies': anomalies}
+
+
+def _weighted_sums(data, weights):
+    """ sum along first axis of data times weights and sum of weights,
+    ignoring missing values """
+    weights = _expand(weights, data)
+    valid = ~np.isnan(data)
+    num = np.where(valid, data, 0.) * weights
+    den = np.where(valid, weights, 0.)
+    num = num.sum(axis=0)
+    den = den.sum(axis=0)
+    return np.where(den > 0, num, np.nan), np.where(den > 0, den, np.nan)
+
+
+def _expand(weights, data):
+    """ weights along first axis broadcastable to data """
+    return weights.reshape((-1,) + (1,) * (data.ndim - 1))
+
+
+def _grow_sums(sums, nsteps, shape):
+    """ weighted sums and sums of weights for nsteps steps of the year,
+    keeping existing sums """
+    grown = (np.zeros((nsteps,) + shape), np.zeros((nsteps,) + shape))
+    if sums is not None:
+        grown[0][:len(sums[0])] = sums[0]
+        grown[1][:len(sums[1])] = sums[1]
+    return grown
@@ -0,0 +1,155 @@
+import os
+import numpy as np
+import netCDF4 as nc
+from .calendars import check_calendar, days_between_years, days_in_year
+from .timeserie_interface import create_pp_path, stream_frequency
+from .writer import output_filename
+
+# Fake FRE PP archives, laid out as
+# <rootdir>/cycle<N>/pp/<stream>/ts/<freq>/<N>yr/<stream>.<start>-<end>.<field>.nc
+# with small files holding the same time variables as FRE output
+# (average_T1, average_T2, average_DT, time_bnds) and a static grid.
+
+
+def make_pp_archive(rootdir, ncycles=3, nyears=10, first_year=1958,
+                    slices=(5, 1), stream='ocean_monthly', freq=None,
+                    fields=('tos',), calendar='noleap', nx=4, ny=3,
+                    seed=0):
+    """ create a synthetic FRE PP archive of ncycles cycles of nyears
+    years each (a list of one value per cycle is also accepted), every
+    cycle restarting at first_year
+
+    slices = number of years in files, one time slice directory each
+    freq = override for frequency, else guessed from stream name
+    fields = fields to create, each one in its own files
+    nx, ny = size of the horizontal grid
+
+    returns the list of pp directories of each cycle
+    """
+    if np.isscalar(nyears):
+        nyears = [nyears] * ncycles
+    rng = np.random.default_rng(seed)
+    ppdirs = []
+    for cycle in range(ncycles):
+        ppdir = f"{rootdir}/cycle{cycle + 1}/pp"
+        for nyr in slices:
+            tsdir = f"{create_pp_path(ppdir, stream, freq)}/{nyr}yr"
+            os.makedirs(tsdir, exist_ok=True)
+            for start_year in range(first_year, first_year + nyears[cycle], nyr):
+                end_year = min(start_year + nyr, first_year + nyears[cycle]) - 1
+                for field in fields:
+                    fname = output_filename(stream, start_year, end_year,
+                                            field, freq=freq)
+                    path = f"{tsdir}/{fname}"
+                    write_pp_file(path, field, start_year, end_year,
+                                  stream=stream, freq=freq,
+                                  origin_year=first_year, calendar=calendar,
+                                  nx=nx, ny=ny, rng=rng)
+        ppdirs.append(ppdir)
+    return ppdirs
+
+
+def write_pp_file(path, field, start_year, end_year, stream='ocean_monthly',
+                  freq=None, origin_year=None, calendar='noleap', nx=4, ny=3,
+                  rng=None):
+    """ write a synthetic PP timeserie file of field for years start_year
+    to end_year, time in days since January 1st of origin_year """
+    if origin_year is None:
+        origin_year = start_year
+    if rng is None:
+        rng = np.random.default_rng()
+    bounds = time_bounds(start_year, end_year, origin_year,
+                         stream_frequency(stream, freq), calendar)
+    units = f"days since {origin_year:04d}-01-01 00:00:00"
+    ntime = len(bounds)
+
+    with nc.Dataset(path, 'w', format='NETCDF3_64BIT') as f:
+        f.createDimension('time', None)
+        f.createDimension('nv', 2)
+        f.createDimension('yh', ny)
+        f.createDimension('xh', nx)
+
+        for name, values, attrs in [
+                ('xh', np.linspace(-300., 60., nx, endpoint=False),
+                 {'units': 'degrees_east', 'long_name': 'h point nominal longitude',
+                  'cartesian_axis': 'X'}),
+                ('yh', np.linspace(-80., 90., ny, endpoint=False),
+                 {'units': 'degrees_north', 'long_name': 'h point nominal latitude',
+                  'cartesian_axis': 'Y'}),
+                ('nv', np.array([1., 2.]),
+                 {'long_name': 'vertex number', 'cartesian_axis': 'N'})]:
+            var = f.createVariable(name, 'f8', (name,))
+            var.setncatts(attrs)
+            var[:] = values
+
+        time = f.createVariable('time', 'f8', ('time',))
+        time.setncatts({'units': units, 'long_name': 'time',
+                        'cartesian_axis': 'T', 'calendar_type': calendar.upper(),
+                        'calendar': calendar, 'bounds': 'time_bnds'})
+        time[:] = bounds.mean(axis=1)
+
+        for name, values, long_name in [
+                ('average_T1', bounds[:, 0], 'Start time for average period'),
+                ('average_T2', bounds[:, 1], 'End time for average period'),
+                ('average_DT', bounds[:, 1] - bounds[:, 0], 'Length of average period')]:
+            var = f.createVariable(name, 'f8', ('time',), fill_value=1.e+20)
+            var.setncatts({'long_name': long_name,
+                           'units': 'days' if name == 'average_DT' else units,
+                           'missing_value': 1.e+20})
+            var[:] = values
+
+        tbnds = f.createVariable('time_bnds', 'f8', ('time', 'nv'),
+                                 fill_value=1.e+20)
+        tbnds.setncatts({'long_name': 'time axis boundaries', 'units': units,
+                         'missing_value': 1.e+20})
+        tbnds[:] = bounds
+
+        for name, values in [('geolon', np.tile(f['xh'][:], (ny, 1))),
+                             ('geolat', np.tile(f['yh'][:][:, None], (1, nx)))]:
+            var = f.createVariable(name, 'f4', ('yh', 'xh'), fill_value=1.e+20)
+            var.setncatts({'long_name': f'Fictitious {name}',
+                           'units': 'degrees',
+                           'missing_value': np.float32(1.e+20)})
+            var[:] = values
+
+        var = f.createVariable(field, 'f4', ('time', 'yh', 'xh'),
+                               fill_value=1.e+20)
+        var.setncatts({'long_name': f'synthetic {field}', 'units': '1',
+                       'missing_value': np.float32(1.e+20),
+                       'cell_methods': 'time: mean',
+                       'time_avg_info': 'average_T1,average_T2,average_DT'})
+        var[:] = rng.random((ntime, ny, nx), dtype=np.float32)
+
+        f.filename = os.path.basename(path)
+        f.title = 'synthetic FRE PP timeserie'
+    return None
+
+
+def time_bounds(start_year, end_year, origin_year, freq, calendar):
+    """ bounds (in days since January 1st of origin_year) of annual,
+    monthly or daily averages from start_year to end_year (included) """
+    calendar = check_calendar(calendar)
+    edges = []
+    for year in range(start_year, end_year + 1):
+        first = days_between_years(origin_year, year, calendar)
+        if freq == 'annual':
+            lengths = [days_in_year(year, calendar)]
+        elif freq == 'monthly':
+            lengths = month_lengths(year, calendar)
+        elif freq == 'daily':
+            lengths = [1] * days_in_year(year, calendar)
+        else:
+            raise ValueError(f"{freq} not supported")
+        edges.extend(first + np.cumsum([0] + lengths[:-1]))
+    edges.append(days_between_years(origin_year, end_year + 1, calendar))
+    edges = np.array(edges, dtype=float)
+    return np.stack([edges[:-1], edges[1:]], axis=1)
+
+
+def month_lengths(year, calendar):
+    """ number of days in each month of year """
+    if check_calendar(calendar) == '360_day':
+        return [30] * 12
+    february = days_in_year(year, calendar) - 337
+    return [31, february, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
@@ -1,48 +1,265 @@
+import calendar
 import glob
+import warnings
 import datetime as dt
+from .catalog import query_catalog
+from .instrument import stage
 
 
-def create_timeserie_monofield(rep, field, pattern=None):
-    """ find files from several time slices and build a unique timeserie """
-    fmatches = find_monofield_files(rep, field, pattern=pattern)
-    out = build_mixed_slices_listfiles(fmatches)
+def create_timeserie_monofield(rep, field, pattern=None, catalog=None,
+                               start=None, end=None):
+    """ find files from several time slices and build a unique timeserie
+
+    catalog = optional catalog database (see refresh_catalog) to query
+              instead of walking directory rep
+    start, end = optional period (YYYY, YYYYMM or YYYYMMDD) to cover with
+                 the fewest files, see cover_time_range. Warns if files
+                 do not cover the whole period or if chosen files
+                 overlap (days would be repeated in the timeserie).
+    """
+    fmatches = find_monofield_files(rep, field, pattern=pattern,
+                                    catalog=catalog)
+    if start is not None or end is not None:
+        out, gaps, overlaps = cover_time_range(fmatches, start=start, end=end)
+        if gaps:
+            periods = ', '.join(f'{first}-{last}' for first, last in gaps)
+            warnings.warn(f"{field} in {rep}: no files for {periods}")
+        for previous, following in overlaps:
+            warnings.warn(f"{field} in {rep}: {previous} and {following} "
+                          "overlap")
+    else:
+        out = build_mixed_slices_listfiles(fmatches)
+    return out
+
+
+def create_timeserie_multifield(rep, fields=None, pattern=None, catalog=None):
+    """ same as create_timeserie_monofield for several fields at once
+    (all fields if fields is None), scanning directory rep only once.
+    Returns a dictionary {field: list of files} """
+    fmatches = find_multifield_files(rep, fields=fields, pattern=pattern,
+                                     catalog=catalog)
+    out = {}
+    for field, listfiles in fmatches.items():
+        out[field] = build_mixed_slices_listfiles(listfiles)
     return out
 
 
-def find_monofield_files(rep, field, pattern=None):
+def stream_frequency(stream, freq=None):
+    """ frequency of timeseries in stream: monthly by default, override
+    if find other freq in stream name or if freq is given """
+    dfreq = 'monthly'
+    if 'annual' in stream:
+        dfreq = 'annual'
+    elif 'daily' in stream:
+        dfreq = 'daily'
+    if freq is not None:
+        dfreq = freq
+    return dfreq
+
+
+def create_pp_path(ppdir, stream, freq=None):
+    """ fill in the path to timeserie """
+    pp_path = f'{ppdir}/{stream}/ts/{stream_frequency(stream, freq)}'
+    return pp_path
+
+
+def find_monofield_files(rep, field, pattern=None, catalog=None):
     """ find all files in directory rep for field field with optional
     pattern"""
-    files = glob.glob(rep + '/' + f'**/*.{field}.nc', recursive=True)
-    matches = []
-    if pattern is not None:
-        for f in files:
-            if (f.find(pattern) != -1):
-                matches.append(f)
-    else:
-        matches = files
+    with stage('find_files', rep=rep, catalog=catalog) as record:
+        if catalog is not None:
+            matches = query_catalog(catalog, rep, field, pattern=pattern)
+        else:
+            files = glob.glob(rep + '/' + f'**/*.{field}.nc', recursive=True)
+            matches = []
+            if pattern is not None:
+                for f in files:
+                    if (f.find(pattern) != -1):
+                        matches.append(f)
+            else:
+                matches = files
+        record['nfiles'] = len(matches)
+    return matches
+
+
+def find_multifield_files(rep, fields=None, pattern=None, catalog=None):
+    """ find all files in directory rep with optional pattern and
+    group them by field (only fields in list fields if not None) """
+    with stage('find_files', rep=rep, catalog=catalog) as record:
+        if catalog is not None:
+            files = query_catalog(catalog, rep, pattern=pattern)
+        else:
+            files = glob.glob(rep + '/' + '**/*.nc', recursive=True)
+        record['nfiles'] = len(files)
+    matches = {}
+    if fields is not None:
+        for field in fields:
+            matches[field] = []
+    for f in files:
+        if (pattern is not None) and (f.find(pattern) == -1):
+            continue
+        # field is what comes after <stream>.<dates>. in filename
+        elements = f[f.rfind('/') + 1:].split('.', 2)
+        if len(elements) != 3:
+            continue
+        field = elements[2][:-3]
+        if fields is None:
+            matches.setdefault(field, []).append(f)
+        elif field in matches:
+            matches[field].append(f)
     return matches
 
 
 def build_mixed_slices_listfiles(listfiles):
     """ from a list of files with different time slices, build a
         unique timeseries monotonically (without duplicates) """
-    slices = available_timeslices(listfiles)
-    ordered_slices = order_timeslices(slices)
+    records = parse_pp_files(listfiles)
+    # longer time slices first, then sorted by path (chronological order
+    # within a time slice directory)
+    records.sort(key=lambda rec: (-rec.nyears, rec.path))
     merged_list = []
-    last = dt.datetime(1, 1, 1)  # bogus last time
-    # loop over slices
-    for tslice in ordered_slices:
-        # build list of files
-        tmplist = filter_by_slice_and_order_chrono(listfiles, tslice)
-        for f in tmplist:
-            fname = f.replace('/', ' ').split()[-1]
-            start, end = get_dates_from_filename(fname)
-            if start > last:
-                merged_list.append(f)
-                last = end
+    last = -1  # before any date, including 0001-01-01
+    for rec in records:
+        if rec.start > last:
+            merged_list.append(rec.path)
+            last = rec.end
     return merged_list
 
 
+def cover_time_range(listfiles, start=None, end=None):
+    """ from a list of files with different time slices, find the fewest
+    files covering the period start to end (YYYY, YYYYMM or YYYYMMDD,
+    default to the period covered by all files)
+
+    returns (files in chronological order, gaps, overlaps) where gaps
+    is a list of (first day, last day) as YYYYMMDD not covered by any
+    file and overlaps a list of (file, next file) sharing some days
+    """
+    records = parse_pp_files(listfiles)
+    if not records:
+        return [], [], []
+    # work with days as half-open intervals [first day, day after end)
+    intervals = sorted(((_day_ordinal(rec.start),
+                         _day_ordinal(rec.end, rec.ndigits, after=True), rec)
+                        for rec in records),
+                       key=lambda interval: (interval[0], interval[1],
+                                             interval[2].index))
+    if start is None:
+        target_start = intervals[0][0]
+    else:
+        target_start = _day_ordinal(date_to_int(str(start)))
+    if end is None:
+        target_end = max(interval[1] for interval in intervals)
+    else:
+        target_end = _day_ordinal(date_to_int(str(end)), len(str(end)),
+                                  after=True)
+
+    chosen = []
+    gaps = []
+    current = target_start
+    k = 0
+    while current < target_end:
+        # among files starting before current, take the one going further
+        # (starting later if tied, to limit overlaps)
+        best = None
+        while k < len(intervals) and intervals[k][0] <= current:
+            if best is None or ((intervals[k][1], intervals[k][0]) >
+                                (best[1], best[0])):
+                best = intervals[k]
+            k += 1
+        if best is not None and best[1] > current:
+            chosen.append(best)
+            current = best[1]
+            continue
+        # nothing covers current day, jump to the next file
+        following = [interval for interval in intervals[k:]
+                     if interval[1] > current]
+        nextstart = following[0][0] if following else target_end
+        gaps.append((_ordinal_to_date(current),
+                     _ordinal_to_date(min(nextstart, target_end) - 1)))
+        current = nextstart
+
+    overlaps = []
+    for previous, following in zip(chosen[:-1], chosen[1:]):
+        if following[0] < previous[1]:
+            overlaps.append((previous[2].path, following[2].path))
+    files = [interval[2].path for interval in chosen]
+    return files, gaps, overlaps
+
+
+def _day_ordinal(date, ndigits=8, after=False):
+    """ day number of YYYYMMDD integer date (days not existing in the
+    gregorian calendar are moved to the end of their month). With after,
+    the day following the period (year, month or day) ending at date """
+    year, monthday = divmod(date, 10000)
+    month, day = divmod(monthday, 100)
+    if not (dt.MINYEAR <= year <= dt.MAXYEAR and 1 <= month <= 12 and
+            day >= 1):
+        raise ValueError(f"invalid date {date:08d}")
+    if after and ndigits == 4:
+        return dt.date(year + 1, 1, 1).toordinal()
+    if after and ndigits == 6:
+        if month == 12:
+            return dt.date(year + 1, 1, 1).toordinal()
+        return dt.date(year, month + 1, 1).toordinal()
+    day = min(day, calendar.monthrange(year, month)[1])
+    ordinal = dt.date(year, month, day).toordinal()
+    return ordinal + 1 if after else ordinal
+
+
+def _ordinal_to_date(ordinal):
+    """ YYYYMMDD string of day number """
+    return dt.date.fromordinal(ordinal).strftime('%Y%m%d')
+
+
+class PPFile:
+    """ compact record of a parsed PP timeserie file: time slice length
+    in years, start and end dates as YYYYMMDD integers, number of digits
+    of dates in filename and index of the path in the list it was parsed
+    from """
+    __slots__ = ('path', 'index', 'nyears', 'start', 'end', 'ndigits')
+
+    def __init__(self, path, index, nyears, start, end, ndigits=8):
+        self.path = path
+        self.index = index
+        self.nyears = nyears
+        self.start = start
+        self.end = end
+        self.ndigits = ndigits
+
+    def __repr__(self):
+        return (f"PPFile({self.path!r}, {self.index}, {self.nyears}, "
+                f"{self.start}, {self.end}, {self.ndigits})")
+
+
+def parse_pp_files(listfiles):
+    """ parse each file path exactly once into a PPFile record """
+    return [parse_pp_file(f, index) for index, f in enumerate(listfiles)]
+
+
+def parse_pp_file(path, index=0):
+    """ parse path <...>/<N>yr/<stream>.<start>-<end>.<field>.nc """
+    islash = path.rfind('/')
+    fname = path[islash + 1:]
+    tslice = path[path.rfind('/', 0, islash) + 1:islash]
+    cstartdate, _, cenddate = fname.split('.')[1].partition('-')
+    return PPFile(path, index, int(tslice.rstrip('yr')),
+                  date_to_int(cstartdate), date_to_int(cenddate),
+                  len(cstartdate))
+
+
+def date_to_int(cdate):
+    """ convert YYYY, YYYYMM or YYYYMMDD string into a YYYYMMDD integer,
+    padding missing month/day with 01 (as strptime does) """
+    if len(cdate) == 4:
+        return int(cdate) * 10000 + 101
+    elif len(cdate) == 6:
+        return int(cdate) * 100 + 1
+    elif len(cdate) == 8:
+        return int(cdate)
+    raise ValueError(f"cannot infer date from {cdate}")
+
+
 def available_timeslices(listfiles):
     """ figure out what time slices are available from list of files """
     tslices = []
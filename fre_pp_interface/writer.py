@@ -0,0 +1,381 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import xarray as xr
+from xarray.backends import NetCDF4DataStore
+from xarray.backends.common import ArrayWriter
+from .calendars import origin_from_units, relabel_years, year_of_day
+from .cycles import merge_from_plan, select_years
+from .instrument import stage
+from .plan import build_merge_plan, output_windows, plan_files
+from .timeserie_interface import stream_frequency
+
+# fill value for time variables: 1599-12-31 in days since 1600-01-01
+TIME_FILL_VALUE = -1.
+# fill value for lon/lat bounds
+BNDS_FILL_VALUE = 1.e+20
+# netcdf formats supporting chunking and compression
+NETCDF4_FORMATS = ("NETCDF4", "NETCDF4_CLASSIC")
+# the HDF5 library is not thread safe, netcdf4 files are written one at a
+# time even when their data is read in parallel
+HDF5_WRITE_LOCK = threading.Lock()
+
+
+def write_timeseries_chunks(ds, outdir, nyears, stream, var, freq=None,
+                            nyears_cycles=None, gaps=None, windows=None,
+                            nworkers=2, max_memory=None,
+                            format="NETCDF3_64BIT", chunks=None,
+                            complevel=None):
+    """ split merged dataset ds (as returned by merge_cycles, time not
+    decoded) into files of nyears years written in directory outdir
+
+    nyears_cycles = number of years in each cycle, output files do not
+                    span several cycles (default: ds is one cycle)
+    gaps = list of gap year (e.g. 1) between cycles
+    windows = list of (start_year, end_year) of each file, overrides
+              nyears, nyears_cycles and gaps
+    nworkers = number of files written at the same time
+    max_memory = maximum size (bytes) of the data of files being written
+                 at the same time (one file is always allowed)
+    format, chunks, complevel = netcdf format and options, see
+                                write_timeseries
+
+    returns the list of written files
+    """
+    if windows is None:
+        windows = timeseries_windows(ds, nyears, nyears_cycles=nyears_cycles,
+                                     gaps=gaps)
+    os.makedirs(outdir, exist_ok=True)
+
+    budget = threading.Condition()
+    inflight = [0]
+
+    def write_one(window):
+        start_year, end_year = window
+        ds_split = select_years(ds, start_year, end_year)
+        nbytes = ds_split.nbytes
+        with budget:
+            budget.wait_for(lambda: (max_memory is None or inflight[0] == 0 or
+                                     inflight[0] + nbytes <= max_memory))
+            inflight[0] += nbytes
+        try:
+            fout = output_filename(stream, start_year, end_year, var, freq)
+            print(f"writing into file {outdir}/{fout}")
+            write_timeseries(ds_split, f"{outdir}/{fout}", format=format,
+                             chunks=chunks, complevel=complevel)
+        finally:
+            with budget:
+                inflight[0] -= nbytes
+                budget.notify_all()
+        return f"{outdir}/{fout}"
+
+    with ThreadPoolExecutor(max_workers=nworkers) as pool:
+        written = list(pool.map(write_one, windows))
+    return written
+
+
+def write_merged_windows(merged_windows, outdir, stream, var, freq=None,
+                         format="NETCDF3_64BIT", chunks=None,
+                         complevel=None):
+    """ write each (start_year, end_year, dataset) of merged_windows
+    (see stream_merge_cycles) into its own file in directory outdir,
+    one window at a time (see write_timeseries for format, chunks and
+    complevel)
+
+    returns the list of written files
+    """
+    os.makedirs(outdir, exist_ok=True)
+    written = []
+    for start_year, end_year, ds in merged_windows:
+        fout = output_filename(stream, start_year, end_year, var, freq)
+        print(f"writing into file {outdir}/{fout}")
+        write_timeseries(ds, f"{outdir}/{fout}", format=format,
+                         chunks=chunks, complevel=complevel)
+        written.append(f"{outdir}/{fout}")
+    return written
+
+
+def update_timeseries(list_of_cycles, outdir, nyears, stream, var, freq=None,
+                      gaps=None, manifest=None, combine='by_coords',
+                      format="NETCDF3_64BIT", chunks=None, complevel=None):
+    """ write or update the files of nyears years in directory outdir
+    from the cycles in list_of_cycles, only rewriting the files whose
+    source files (path, size, mtime) changed since the last update
+
+    manifest = json file recording the source files of each output file
+               (default: <stream>.<var>.manifest.json in outdir)
+
+    returns the list of written files
+    """
+    os.makedirs(outdir, exist_ok=True)
+    if manifest is None:
+        manifest = f"{outdir}/{stream}.{var}.manifest.json"
+    previous = {'units': None, 'offsets': None, 'outputs': {}}
+    if os.path.exists(manifest):
+        previous = load_manifest(manifest)
+
+    plan = build_merge_plan(list_of_cycles, gaps=gaps, nyears_file=nyears,
+                            read_all=False)
+    offsets = [cycle['offset'] for cycle in plan['cycles']]
+    # time values of every output file change with units or offsets
+    rewrite_all = (previous['units'] != plan['units'] or
+                   previous['offsets'] != offsets)
+
+    outputs = {}
+    written = []
+    for start_year, end_year in plan['windows']:
+        fout = output_filename(stream, start_year, end_year, var, freq)
+        sources = []
+        for files in plan_files(plan, start_year, end_year):
+            for f in files:
+                st = os.stat(f)
+                sources.append([f, st.st_size, st.st_mtime])
+        outputs[fout] = {'window': [start_year, end_year],
+                         'sources': sources}
+        old = previous['outputs'].get(fout)
+        if (not rewrite_all and old is not None and old['sources'] == sources
+                and os.path.exists(f"{outdir}/{fout}")):
+            continue
+        ds = merge_from_plan(plan, start_year, end_year, combine=combine)
+        print(f"writing into file {outdir}/{fout}")
+        write_timeseries(ds, f"{outdir}/{fout}", format=format,
+                         chunks=chunks, complevel=complevel)
+        written.append(f"{outdir}/{fout}")
+
+    # files replaced by a window with other years (e.g. last file of a
+    # cycle that got more years)
+    for fout in previous['outputs']:
+        if fout not in outputs and os.path.exists(f"{outdir}/{fout}"):
+            print(f"removing outdated file {outdir}/{fout}")
+            os.remove(f"{outdir}/{fout}")
+
+    save_manifest({'units': plan['units'], 'offsets': offsets,
+                   'outputs': outputs}, manifest)
+    return written
+
+
+def save_manifest(manifest, path):
+    """ save manifest of output files into json file """
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+
+def load_manifest(path):
+    """ load manifest of output files from json file """
+    with open(path) as f:
+        manifest = json.load(f)
+    return manifest
+
+
+def timeseries_windows(ds, nyears, nyears_cycles=None, gaps=None):
+    """ start and end years of output files of nyears years for merged
+    dataset ds, see output_windows """
+    time = ds['time']
+    origin_year = origin_from_units(time.attrs['units']).year
+    calendar = time.attrs['calendar']
+    first_year = year_of_day(float(time[0].values), origin_year, calendar)
+    if nyears_cycles is None:
+        last_year = year_of_day(float(time[-1].values), origin_year, calendar)
+        nyears_cycles = [last_year - first_year + 1]
+    if gaps is None:
+        gaps = [0] * (len(nyears_cycles) - 1)
+    first_years = [first_year]
+    for nyears_cycle, gap in zip(nyears_cycles[:-1], gaps):
+        first_years.append(first_years[-1] + nyears_cycle + gap)
+    return output_windows(first_years, nyears_cycles, nyears)
+
+
+def write_timeseries(ds, path, format="NETCDF3_64BIT", chunks=None,
+                     complevel=None):
+    """ write timeseries into file path, fixing fill values and time
+    bounds attribute on the way
+
+    format = netcdf format, chunks and complevel need NETCDF4 or
+             NETCDF4_CLASSIC
+    chunks = dictionary of chunk size for each dimension of data
+             variables (e.g. {'time': 12}), see chunk_sizes
+    complevel = zlib compression level of data variables (1 to 9)
+    """
+    ds = fix_encoding(ds)
+    ds.attrs["filename"] = os.path.basename(path)
+    if format in NETCDF4_FORMATS:
+        for var, chunksizes in chunk_sizes(ds, chunks).items():
+            ds[var].encoding.update({"contiguous": False,
+                                     "chunksizes": chunksizes})
+            if complevel is not None:
+                ds[var].encoding.update({"zlib": True, "complevel": complevel,
+                                         "shuffle": True})
+        # read data before taking the lock
+        with stage('read', path=path):
+            ds = ds.load()
+        with HDF5_WRITE_LOCK:
+            with stage('write', nfiles=1, path=path):
+                _write_netcdf(ds, path, format)
+    elif chunks is not None or complevel is not None:
+        raise ValueError(f"chunks and compression not supported by {format}")
+    else:
+        with stage('write', nfiles=1, path=path):
+            _write_netcdf(ds, path, format)
+    return None
+
+
+def _write_netcdf(ds, path, format):
+    """ write ds into netcdf file path, setting time bounds attribute """
+    # xarray uses bounds attribute of time to define attrs of time_bnds
+    # hence messing up our attrs. So bounds is added once xarray is done
+    # encoding, before the file is closed
+    store = NetCDF4DataStore.open(path, mode="w", format=format)
+    try:
+        writer = ArrayWriter()
+        ds.dump_to_store(store, writer=writer, unlimited_dims=["time"])
+        writer.sync()
+        if "time_bnds" in ds.variables:
+            store.ds.variables["time"].setncattr("bounds", "time_bnds")
+    finally:
+        store.close()
+    return None
+
+
+def write_zarr(ds, store, chunks=None, append=False):
+    """ write timeseries into zarr store, or append to it the time steps
+    of ds after the last time step of the store
+
+    ds can be the merged dataset of all cycles available so far (or one
+    window of stream_merge_cycles), its years are relabelled to the units
+    of the store when they differ (merging more cycles moves the origin
+    of the time axis back)
+
+    chunks = dictionary of chunk size for each dimension of data
+             variables (e.g. {'time': 12}), see chunk_sizes. Only used
+             when the store is created.
+    """
+    import zarr
+
+    append = append and os.path.exists(store)
+    if append:
+        existing = xr.open_zarr(store, decode_times=False)
+        units = existing['time'].attrs['units']
+        last = float(existing['time'][-1].values)
+        # new time steps are written with the chunks of the store
+        store_chunks = {var: existing[var].encoding["chunks"]
+                        for var in existing.data_vars
+                        if 'time' in existing[var].dims}
+        existing.close()
+        if units != ds['time'].attrs['units']:
+            # cycles appended since the store was created moved the origin
+            # back by whole years: relabel years to the origin of the store
+            origin_year = origin_from_units(ds['time'].attrs['units']).year
+            store_year = origin_from_units(units).year
+            calendar = ds['time'].attrs['calendar']
+            ds = ds.copy()
+            for var in ["time", "average_T1", "average_T2", "time_bnds"]:
+                if var in ds.variables:
+                    values = relabel_years(ds[var].values, origin_year,
+                                           store_year, calendar)
+                    ds[var] = ds[var].copy(data=values)
+                    ds[var].attrs["units"] = units
+
+    ds = fix_encoding(ds)
+    for var in ds.variables:
+        for key in ["chunks", "preferred_chunks", "chunksizes", "contiguous",
+                    "zlib", "complevel", "shuffle"]:
+            ds[var].encoding.pop(key, None)
+    if append:
+        ds = ds.isel(time=np.flatnonzero(ds['time'].values > last))
+        if ds.sizes['time'] == 0:
+            print(f"no new time steps to append to {store}")
+            return None
+        # variables without time were written with the first time steps
+        ds = ds.drop_vars([var for var in ds.variables
+                           if 'time' not in ds[var].dims])
+        # fill values are taken from the store
+        for var in ds.variables:
+            ds[var].attrs.pop("missing_value", None)
+        print(f"appending {ds.sizes['time']} time steps to {store}")
+        ds = rechunk_variables(ds, store_chunks)
+        with stage('write_zarr', store=store, append=True):
+            ds.to_zarr(store, mode="a", append_dim="time", consolidated=True)
+    else:
+        print(f"writing into store {store}")
+        store_chunks = chunk_sizes(ds, chunks)
+        # other variables along time are stored in one chunk
+        for var in ds.data_vars:
+            if var not in store_chunks and 'time' in ds[var].dims:
+                store_chunks[var] = ds[var].shape
+        ds = rechunk_variables(ds, store_chunks)
+        for var, chunksizes in store_chunks.items():
+            ds[var].encoding["chunks"] = chunksizes
+        with stage('write_zarr', store=store, append=False):
+            ds.to_zarr(store, mode="w", consolidated=True)
+    # same as netcdf, bounds is added once xarray is done encoding
+    if "time_bnds" in ds.variables:
+        zarr.open_group(store, mode="r+")["time"].attrs["bounds"] = "time_bnds"
+        zarr.consolidate_metadata(store)
+    return None
+
+
+def fix_encoding(ds):
+    """ copy of ds with fill values of time and bounds variables fixed """
+    ds = ds.copy()
+    # fix _FillValue
+    for kvar in list(ds.coords):
+        ds[kvar].encoding.update({"_FillValue": None})
+    for kvar in ["average_T1", "average_T2", "time_bnds"]:
+        if kvar in ds.variables:
+            ds[kvar].encoding.update({"dtype": np.float64,
+                                      "_FillValue": TIME_FILL_VALUE})
+            ds[kvar].attrs.update({"missing_value": TIME_FILL_VALUE})
+    for kvar in ["lon_bnds", "lat_bnds"]:
+        if kvar in ds.variables:
+            ds[kvar].encoding.update({"_FillValue": BNDS_FILL_VALUE})
+    return ds
+
+
+def rechunk_variables(ds, var_chunks):
+    """ rechunk (with dask) each variable of ds to the chunk sizes given
+    in dictionary var_chunks, zarr needs chunks of the same size """
+    ds = ds.copy()
+    for var, chunksizes in var_chunks.items():
+        if var in ds.variables:
+            ds[var] = ds[var].chunk(dict(zip(ds[var].dims, chunksizes)))
+    return ds
+
+
+def chunk_sizes(ds, chunks=None):
+    """ chunk sizes of the data variables of ds with at least 2 dimensions
+    (time bounds excepted): one time step and the whole of other
+    dimensions, unless given in dictionary chunks """
+    sizes = {}
+    for var in ds.data_vars:
+        if ds[var].ndim < 2 or var == "time_bnds":
+            continue
+        varchunks = []
+        for dim, size in ds[var].sizes.items():
+            default = 1 if dim == "time" else size
+            if chunks is not None:
+                default = chunks.get(dim, default)
+            varchunks.append(max(min(default, size), 1))
+        sizes[var] = tuple(varchunks)
+    return sizes
+
+
+def create_out_path(outputdir, stream, cyears, freq=None):
+    """ path to output timeseries of cyears years """
+    out_path = f"{outputdir}/{stream}/ts/{stream_frequency(stream, freq)}/{cyears}yr"
+    return out_path
+
+
+def output_filename(stream, start_year, end_year, var, freq=None):
+    """ name of output file for years start_year to end_year """
+    dfreq = stream_frequency(stream, freq)
+    if dfreq == "annual":
+        fout = f"{stream}.{start_year:04d}-{end_year:04d}.{var}.nc"
+    elif dfreq == "monthly":
+        fout = f"{stream}.{start_year:04d}01-{end_year:04d}12.{var}.nc"
+    elif dfreq == "daily":
+        fout = f"{stream}.{start_year:04d}0101-{end_year:04d}1231.{var}.nc"
+    else:
+        raise ValueError(f"{dfreq} not supported")
+    return fout
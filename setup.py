@@ -10,5 +10,11 @@ setuptools.setup(
     license="GPLv3",
     keywords="",
     url="https://github.com/raphaeldussin/fre_pp_interface",
-    packages=['fre_pp_interface']
+    packages=['fre_pp_interface'],
+    entry_points={
+        'console_scripts': [
+            'fre-pp = fre_pp_interface.cli:main',
+            'fre-pp-batch = fre_pp_interface.batch:main',
+        ],
+    },
 )
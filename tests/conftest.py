@@ -0,0 +1,19 @@
+import pytest
+from fre_pp_interface.synthetic import make_pp_archive
+from fre_pp_interface.timeserie_interface import (create_pp_path,
+                                                  create_timeserie_monofield)
+
+
+@pytest.fixture
+def ppdirs(tmp_path):
+    """ pp directories of the cycles of a small synthetic archive """
+    return make_pp_archive(str(tmp_path / 'archive'), ncycles=3, nyears=4,
+                           slices=(2,))
+
+
+@pytest.fixture
+def list_of_cycles(ppdirs):
+    """ files of field tos in each cycle of a small synthetic archive """
+    return [create_timeserie_monofield(create_pp_path(ppdir, 'ocean_monthly'),
+                                       'tos')
+            for ppdir in ppdirs]
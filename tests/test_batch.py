@@ -0,0 +1,27 @@
+import multiprocessing
+import os
+from fre_pp_interface.batch import run_job
+
+
+def run_job_into_queue(queue, *args, **kwargs):
+    """ run_job in a child process, result or error sent into queue """
+    try:
+        queue.put(run_job(*args, **kwargs))
+    except Exception as error:
+        queue.put(repr(error))
+
+
+def test_run_job_in_daemonic_process(list_of_cycles, tmp_path):
+    # dask workers are daemonic processes, which can not start children
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_job_into_queue,
+                              args=(queue, 'ocean_monthly', 'tos',
+                                    list_of_cycles, str(tmp_path / 'out'), 4),
+                              kwargs={'gaps': [0, 1]}, daemon=True)
+    process.start()
+    result = queue.get(timeout=120)
+    process.join()
+    assert isinstance(result, list), result
+    assert len(result) == 3
+    assert all(os.path.exists(f) for f in result)
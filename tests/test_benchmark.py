@@ -0,0 +1,74 @@
+import os
+import pytest
+import fre_pp_interface as pp
+
+# timings of the stages of examples/benchmark_suite.py on a small archive,
+# measured with pytest-benchmark when installed (pytest --benchmark-only),
+# run once as smoke tests otherwise
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    @pytest.fixture
+    def benchmark():
+        """ run the function once, without timing """
+        return lambda func, *args, **kwargs: func(*args, **kwargs)
+
+stream = 'ocean_monthly'
+var = 'tos'
+gaps = [0, 0]
+nyears_file = 5
+
+
+@pytest.fixture(scope='module')
+def archive(tmp_path_factory):
+    """ pp directories of a small archive with several time slices """
+    rootdir = str(tmp_path_factory.mktemp('benchmark'))
+    ppdirs = pp.make_pp_archive(rootdir, ncycles=3, nyears=12,
+                                slices=(5, 1), stream=stream,
+                                fields=(var, 'sos'), nx=8, ny=6)
+    return [pp.create_pp_path(ppdir, stream) for ppdir in ppdirs]
+
+
+@pytest.fixture(scope='module')
+def cycles(archive):
+    """ files of var in each cycle of the archive """
+    return [pp.create_timeserie_monofield(rep, var) for rep in archive]
+
+
+def test_discovery(benchmark, archive, cycles):
+    found = benchmark(lambda: [pp.build_mixed_slices_listfiles(
+        pp.find_monofield_files(rep, var)) for rep in archive])
+    assert found == cycles
+
+
+def test_catalog(benchmark, archive, cycles, tmp_path):
+    catalog = str(tmp_path / 'catalog.db')
+    for rep in archive:
+        pp.refresh_catalog(catalog, rep)
+    # warm refresh, no directory changed
+    nscanned = benchmark(lambda: [pp.refresh_catalog(catalog, rep)
+                                  for rep in archive])
+    assert nscanned == [0] * len(archive)
+    found = [pp.create_timeserie_monofield(rep, var, catalog=catalog)
+             for rep in archive]
+    assert found == cycles
+
+
+def test_plan(benchmark, cycles):
+    plan = benchmark(pp.build_merge_plan, cycles, gaps=gaps,
+                     nyears_file=nyears_file)
+    assert plan['windows']
+
+
+def test_merge(benchmark, cycles):
+    ds = benchmark(lambda: pp.merge_cycles(cycles, gaps=gaps).load())
+    assert ds.sizes['time'] == 3 * 12 * 12
+
+
+def test_write(benchmark, cycles, tmp_path):
+    ds = pp.merge_cycles(cycles, gaps=gaps).load()
+    written = benchmark(pp.write_timeseries_chunks, ds, str(tmp_path),
+                        nyears_file, stream, var, nyears_cycles=[12] * 3,
+                        gaps=gaps)
+    assert written and all(os.path.isfile(f) for f in written)
@@ -0,0 +1,81 @@
+import datetime as dt
+import cftime
+import numpy as np
+import pytest
+from fre_pp_interface.calendars import (compute_cycle_offsets,
+                                        days_between_years)
+
+CALENDARS = ['noleap', '365_day', '360_day', 'all_leap', '366_day', 'julian',
+             'proleptic_gregorian', 'standard', 'gregorian']
+
+
+@pytest.mark.parametrize('calendar', CALENDARS)
+def test_days_between_years(calendar):
+    rng = np.random.default_rng(0)
+    years = list(zip(rng.integers(1, 3000, 300), rng.integers(0, 400, 300)))
+    # around the start of the gregorian calendar
+    years += [(1580, 5), (1582, 1), (1583, 0), (1500, 100)]
+    for year1, nyears in years:
+        year1, year2 = int(year1), int(year1 + nyears)
+        expected = cftime.date2num(cftime.datetime(year2, 1, 1,
+                                                   calendar=calendar),
+                                   f"days since {year1:04d}-01-01 00:00:00",
+                                   calendar=calendar)
+        assert days_between_years(year1, year2, calendar) == expected
+
+
+def legacy_merge(cycles, gaps):
+    """ time values and units of cycles merged two at a time as the legacy
+    merge_2_datasets did for the julian ('leap') calendar: 365 days per
+    year plus one leap day every 4 years, the values of the first cycles
+    are kept and read from the new origin
+
+    cycles = list of (time values, units)
+    """
+    values, units = cycles[0]
+    merged = [values]
+    for (values2, units2), gap in zip(cycles[1:], gaps):
+        ndays = np.concatenate(merged)
+        nyears = np.floor((ndays[-1] - ndays[0]) / 365. + 1)
+        origin1 = dt.datetime.strptime(units, "days since %Y-%m-%d %H:%M:%S")
+        origin2 = dt.datetime.strptime(units2, "days since %Y-%m-%d %H:%M:%S")
+        offset_years = origin1.year + nyears - origin2.year + gap
+        units = f"days since {int(origin1.year - offset_years):04d}-01-01 00:00:00"
+        merged.append(values2 + (nyears + gap) * 365. +
+                      np.divmod(nyears + gap, 4)[0])
+    return merged, units
+
+
+def monthly_time(first_year, nyears):
+    """ middle of each month of nyears years in the julian calendar """
+    units = f"days since {first_year:04d}-01-01 00:00:00"
+    bounds = cftime.date2num([cftime.datetime(first_year + m // 12,
+                                              m % 12 + 1, 1,
+                                              calendar='julian')
+                              for m in range(12 * nyears + 1)],
+                             units, calendar='julian')
+    return (bounds[:-1] + bounds[1:]) / 2., units
+
+
+@pytest.mark.parametrize('first_year', [1948, 1949, 1950, 1951])
+@pytest.mark.parametrize('nyears, gaps', [([8, 8, 8], [0, 0]),
+                                          ([7, 9, 5], [1, 3]),
+                                          ([20, 20], [0]),
+                                          ([61, 61], [3]),
+                                          ([10, 10, 10], [1, 2])])
+def test_cycle_offsets_legacy_julian(first_year, nyears, gaps):
+    cycles = [monthly_time(first_year, n) for n in nyears]
+    legacy, legacy_units = legacy_merge(cycles, gaps)
+    spans = [(values[0], values[-1], units, 'julian')
+             for values, units in cycles]
+    offsets, units = compute_cycle_offsets(spans, gaps=gaps)
+    assert units == legacy_units
+    for (values, _), offset, expected in zip(cycles, offsets, legacy):
+        dates = cftime.num2date(values + offset, units, calendar='julian')
+        legacy_dates = cftime.num2date(expected, units, calendar='julian')
+        # the legacy leap days heuristic can be one day off, months can not
+        assert ([(d.year, d.month) for d in dates] ==
+                [(d.year, d.month) for d in legacy_dates])
+        if first_year % 4 == 0:
+            # cycles start on leap years: the legacy heuristic is exact
+            assert np.array_equal(values + offset, expected)
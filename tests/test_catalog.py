@@ -0,0 +1,56 @@
+import glob
+import os
+import shutil
+from fre_pp_interface.catalog import query_catalog, refresh_catalog
+from fre_pp_interface.timeserie_interface import create_pp_path
+
+
+def glob_files(rep, field):
+    """ files of field below rep, found without the catalog """
+    return sorted(glob.glob(f"{rep}/**/*.{field}.nc", recursive=True))
+
+
+def test_catalog_same_as_glob(ppdirs, tmp_path):
+    dbfile = str(tmp_path / 'catalog.db')
+    archive = os.path.dirname(os.path.dirname(ppdirs[0]))
+    refresh_catalog(dbfile, archive)
+    for ppdir in ppdirs:
+        rep = create_pp_path(ppdir, 'ocean_monthly')
+        assert sorted(query_catalog(dbfile, rep, 'tos')) == glob_files(rep, 'tos')
+    assert query_catalog(dbfile, archive, 'thetao') == []
+
+
+def test_incremental_refresh(ppdirs, tmp_path):
+    dbfile = str(tmp_path / 'catalog.db')
+    archive = os.path.dirname(os.path.dirname(ppdirs[0]))
+    ndirs = refresh_catalog(dbfile, archive)
+    assert ndirs > 0
+    # nothing changed: no directory listed again
+    assert refresh_catalog(dbfile, archive) == 0
+
+    # new file: only its directory is listed again
+    rep = create_pp_path(ppdirs[0], 'ocean_monthly')
+    tsdir = f"{rep}/2yr"
+    new = f"{tsdir}/ocean_monthly.196201-196312.tos.nc"
+    shutil.copy(glob_files(rep, 'tos')[0], new)
+    os.utime(tsdir, (0, os.stat(tsdir).st_mtime + 10))
+    assert refresh_catalog(dbfile, archive) == 1
+    assert new in query_catalog(dbfile, rep, 'tos')
+
+    # removed directory: its files are forgotten
+    shutil.rmtree(ppdirs[1])
+    os.utime(os.path.dirname(ppdirs[1]),
+             (0, os.stat(os.path.dirname(ppdirs[1])).st_mtime + 10))
+    assert refresh_catalog(dbfile, archive) == 1
+    assert query_catalog(dbfile, ppdirs[1]) == []
+    assert sorted(query_catalog(dbfile, archive, 'tos')) == \
+        glob_files(archive, 'tos')
+
+
+def test_symlink_loop(ppdirs, tmp_path):
+    dbfile = str(tmp_path / 'catalog.db')
+    rep = create_pp_path(ppdirs[0], 'ocean_monthly')
+    files = glob_files(rep, 'tos')
+    os.symlink(ppdirs[0], f"{rep}/loop")
+    refresh_catalog(dbfile, ppdirs[0])
+    assert sorted(query_catalog(dbfile, ppdirs[0], 'tos')) == files
@@ -0,0 +1,63 @@
+import netCDF4 as nc
+import numpy as np
+import pytest
+import xarray as xr
+from fre_pp_interface.cycles import merge_cycles
+from fre_pp_interface.synthetic import write_pp_file
+
+
+def test_grid_cache_same_as_open_mfdataset(list_of_cycles):
+    ds = merge_cycles(list_of_cycles, gaps=[0, 1]).load()
+    grid_cache = {}
+    cached = merge_cycles(list_of_cycles, gaps=[0, 1],
+                          grid_cache=grid_cache).load()
+    xr.testing.assert_identical(cached, ds)
+    assert len(grid_cache) == 1
+    # grid shared, not copied
+    grid = list(grid_cache.values())[0]['grid']
+    again = merge_cycles(list_of_cycles, gaps=[0, 1], grid_cache=grid_cache)
+    assert np.shares_memory(again['geolon'].values, grid['geolon'].values)
+
+
+def test_grid_cache_selections(list_of_cycles):
+    selections = {'sel': {'yh': slice(0.5, 2.5)}, 'isel': {'xh': [2, 0]}}
+    ds = merge_cycles(list_of_cycles, gaps=[0, 1], **selections).load()
+    cached = merge_cycles(list_of_cycles, gaps=[0, 1], grid_cache={},
+                          **selections).load()
+    xr.testing.assert_identical(cached, ds)
+
+
+def test_grid_cache_different_grid(list_of_cycles):
+    path = list_of_cycles[1][-1]
+    with nc.Dataset(path, 'a') as f:
+        f.createDimension('zl', 2)
+        f.createVariable('zl', 'f8', ('zl',))[:] = [0., 1.]
+    with pytest.raises(ValueError, match='differs from the cached grid'):
+        merge_cycles(list_of_cycles, gaps=[0, 1], grid_cache={})
+
+
+def test_grid_cache_fields_on_different_grids(list_of_cycles, tmp_path):
+    # a field of the same stream on a grid with one more longitude
+    other_cycles = []
+    for k, cycle in enumerate(list_of_cycles):
+        files = []
+        first_year = int(cycle[0].split('.')[-3][:4])
+        for f in cycle:
+            start, end = f.split('.')[-3].split('-')
+            path = str(tmp_path / f'cycle{k}.{start}-{end}.uo.nc')
+            write_pp_file(path, 'uo', int(start[:4]), int(end[:4]),
+                          origin_year=first_year, nx=5)
+            files.append(path)
+        other_cycles.append(files)
+    grid_cache = {}
+    for cycles in [list_of_cycles, other_cycles, list_of_cycles]:
+        ds = merge_cycles(cycles, gaps=[0, 1]).load()
+        cached = merge_cycles(cycles, gaps=[0, 1],
+                              grid_cache=grid_cache).load()
+        xr.testing.assert_identical(cached, ds)
+    assert len(grid_cache) == 2
+
+
+def test_merge_years_without_files(list_of_cycles):
+    with pytest.raises(ValueError, match='no files for years 2100 to None'):
+        merge_cycles(list_of_cycles, gaps=[0, 1], start_year=2100)
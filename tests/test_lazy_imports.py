@@ -0,0 +1,35 @@
+import subprocess
+import sys
+import fre_pp_interface as pp
+from fre_pp_interface.synthetic import make_pp_archive
+
+LISTING = """
+import sys
+import fre_pp_interface.cli
+fre_pp_interface.cli.main(['list', '-p', {ppdir!r}, '-s', 'ocean_monthly',
+                           '-v', 'tos'])
+heavy = [name for name in ['xarray', 'numpy', 'netCDF4']
+         if name in sys.modules]
+print('heavy modules:', heavy)
+"""
+
+
+def test_listing_does_not_import_heavy_modules(tmp_path):
+    ppdir, = make_pp_archive(str(tmp_path), ncycles=1, nyears=2)
+    proc = subprocess.run([sys.executable, '-c', LISTING.format(ppdir=ppdir)],
+                          stdout=subprocess.PIPE, text=True, check=True)
+    assert f'# {ppdir}:' in proc.stdout
+    assert 'heavy modules: []' in proc.stdout
+
+
+def test_submodules_as_attributes():
+    proc = subprocess.run(
+        [sys.executable, '-c',
+         'import fre_pp_interface as pp; '
+         'print(pp.cycles.__name__, pp.cli.__name__, '
+         'pp.timeserie_interface.__name__)'],
+        stdout=subprocess.PIPE, text=True, check=True)
+    assert proc.stdout.split() == ['fre_pp_interface.cycles',
+                                   'fre_pp_interface.cli',
+                                   'fre_pp_interface.timeserie_interface']
+    assert pp.merge_cycles is pp.cycles.merge_cycles
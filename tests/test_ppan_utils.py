@@ -0,0 +1,90 @@
+import os
+import stat
+import pytest
+from fre_pp_interface.ppan_utils import (clear_residency_cache,
+                                         local_residency, recall_files)
+
+# stand-in for dmget -v -d <directory> <files>: logs each call, fails for
+# files named bad* and the first time it is called with files named flaky*
+DMGET = """#!/bin/sh
+shift; shift; dir=$1; shift
+echo "$*" >> {log}
+for f in "$@"; do
+  case $f in
+    bad*) exit 1;;
+    flaky*) if [ ! -e {log}.flaky ]; then touch {log}.flaky; exit 1; fi;;
+  esac
+  test -e "$dir/$f" || exit 1
+done
+exit 0
+"""
+
+
+@pytest.fixture
+def dmget(tmp_path):
+    """ stand-in dmget command and the file logging its calls """
+    log = tmp_path / 'dmget.log'
+    script = tmp_path / 'dmget'
+    script.write_text(DMGET.format(log=log))
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    return (str(script), '-v'), log
+
+
+def make_files(directory, names):
+    """ create empty files, returns their paths """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name in names:
+        path = f"{directory}/{name}"
+        open(path, 'w').close()
+        paths.append(path)
+    return paths
+
+
+def calls(log):
+    """ files of each dmget call """
+    return [line.split() for line in log.read_text().splitlines()]
+
+
+def test_recall_batches(dmget, tmp_path):
+    dmget_cmd, log = dmget
+    files = (make_files(tmp_path / 'a', [f'f{k}.nc' for k in range(5)]) +
+             make_files(tmp_path / 'b', ['g0.nc']))
+    result = recall_files(files, max_files=2, dmget_cmd=dmget_cmd,
+                          retry_wait=0.)
+    assert result == {f: True for f in files}
+    # 3 batches in a, 1 in b
+    assert sorted(len(call) for call in calls(log)) == [1, 1, 2, 2]
+
+
+def test_recall_retries(dmget, tmp_path):
+    dmget_cmd, log = dmget
+    files = make_files(tmp_path, ['flaky.nc', 'f.nc'])
+    result = recall_files(files, dmget_cmd=dmget_cmd, retries=1,
+                          retry_wait=0.)
+    assert result == {f: True for f in files}
+    assert calls(log) == [['flaky.nc', 'f.nc']] * 2
+
+
+def test_recall_failures_per_file(dmget, tmp_path):
+    dmget_cmd, log = dmget
+    files = make_files(tmp_path, ['f0.nc', 'bad.nc', 'f1.nc'])
+    missing = f"{tmp_path}/missing.nc"
+    result = recall_files(files + [missing], dmget_cmd=dmget_cmd,
+                          retries=2, retry_wait=0.)
+    assert result == {files[0]: True, files[1]: False, files[2]: True,
+                      missing: False}
+    # batch tried 3 times, then each file once
+    assert len(calls(log)) == 3 + 4
+
+
+def test_recall_skip_online(dmget, tmp_path):
+    dmget_cmd, log = dmget
+    clear_residency_cache()
+    files = make_files(tmp_path, ['f0.nc'])
+    missing = f"{tmp_path}/missing.nc"
+    result = recall_files(files + [missing], dmget_cmd=dmget_cmd,
+                          retries=0, skip_online=True,
+                          backend=local_residency)
+    assert result == {files[0]: True, missing: False}
+    assert calls(log) == [['missing.nc']]
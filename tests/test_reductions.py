@@ -0,0 +1,34 @@
+import numpy as np
+from fre_pp_interface.calendars import days_between_years
+from fre_pp_interface.reductions import steps_of_year
+
+
+def daily_steps(year, calendar):
+    """ steps of year of daily time steps of year (days since 1950) """
+    start = days_between_years(1950, year, calendar)
+    end = days_between_years(1950, year + 1, calendar)
+    return steps_of_year(np.arange(start, end) + 0.5, year, 1950, calendar,
+                         1.)
+
+
+def test_daily_steps_keyed_by_date():
+    leap = daily_steps(1952, 'julian')
+    other = daily_steps(1953, 'julian')
+    assert len(leap) == 366 and leap.max() == other.max() == 364
+    # February 29th with February 28th, March 1st at the same step
+    assert leap[58] == leap[59] == other[58]
+    assert leap[60] == other[59]
+    assert np.array_equal(np.unique(leap), other)
+    assert daily_steps(1952, 'all_leap').max() == 365
+    assert daily_steps(1952, '360_day').max() == 359
+
+
+def test_monthly_steps():
+    for year, calendar in [(1952, 'julian'), (1953, 'julian'),
+                           (1952, 'noleap'), (1952, '360_day')]:
+        start = days_between_years(1950, year, calendar)
+        ndays = days_between_years(year, year + 1, calendar)
+        # middle of each month, roughly
+        days = start + (np.arange(12) + 0.5) * ndays / 12
+        steps = steps_of_year(days, year, 1950, calendar, ndays / 12)
+        assert np.array_equal(steps, np.arange(12))
@@ -0,0 +1,56 @@
+import pytest
+from fre_pp_interface.cli import main
+from fre_pp_interface.synthetic import make_pp_archive
+from fre_pp_interface.timeserie_interface import (build_mixed_slices_listfiles,
+                                                  cover_time_range,
+                                                  create_pp_path,
+                                                  create_timeserie_monofield)
+
+
+def test_period_not_covered(tmp_path, capsys):
+    ppdir, = make_pp_archive(str(tmp_path), ncycles=1, nyears=4,
+                             slices=(2,))
+    rep = create_pp_path(ppdir, 'ocean_monthly')
+    with pytest.warns(UserWarning, match='no files for 19560101-19571231'):
+        files = create_timeserie_monofield(rep, 'tos', start=1956, end=1959)
+    assert len(files) == 1
+    main(['list', '-p', ppdir, '-s', 'ocean_monthly', '-v', 'tos',
+          '--start', '1956', '--end', '1963'])
+    out = capsys.readouterr().out
+    assert 'no files for 19560101-19571231' in out
+    assert 'no files for 19620101-19631231' in out
+
+
+def test_invalid_dates_in_filenames():
+    # day clamped to the end of the month, other invalid dates raise
+    files, gaps, _ = cover_time_range(
+        ['/pp/ts/monthly/1yr/ocean_monthly.19500101-19500231.tos.nc'])
+    assert gaps == []
+    for dates in ['000001-000012', '195013-195112', '195000-195012']:
+        with pytest.raises(ValueError, match='invalid date'):
+            cover_time_range([f'/pp/ts/monthly/1yr/ocean_monthly.{dates}.tos.nc'])
+
+
+def test_overlapping_files(tmp_path, capsys):
+    ppdir = str(tmp_path / 'pp')
+    rep = create_pp_path(ppdir, 'ocean_monthly')
+    for slices in ['5yr/ocean_monthly.195001-195412.tos.nc',
+                   '10yr/ocean_monthly.195101-196012.tos.nc']:
+        path = tmp_path / rep / slices
+        path.parent.mkdir(parents=True)
+        path.touch()
+    with pytest.warns(UserWarning, match='overlap'):
+        files = create_timeserie_monofield(rep, 'tos', start=1950, end=1960)
+    assert len(files) == 2
+    main(['list', '-p', ppdir, '-s', 'ocean_monthly', '-v', 'tos',
+          '--start', '1950', '--end', '1960'])
+    out = capsys.readouterr().out
+    assert 'ocean_monthly.195001-195412.tos.nc and' in out
+    assert sum(line.endswith(' overlap') for line in out.splitlines()) == 1
+
+
+def test_files_starting_on_first_day():
+    files = ['pp/ocean_monthly/ts/monthly/5yr/'
+             f'ocean_monthly.{start:04d}01-{start + 4:04d}12.tos.nc'
+             for start in [6, 1]]
+    assert build_mixed_slices_listfiles(files) == files[::-1]
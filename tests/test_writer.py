@@ -0,0 +1,110 @@
+import os
+import cftime
+import numpy as np
+import pytest
+import xarray as xr
+from fre_pp_interface.calendars import origin_from_units
+from fre_pp_interface.cycles import merge_cycles
+from fre_pp_interface.synthetic import make_pp_archive, write_pp_file
+from fre_pp_interface.timeserie_interface import (create_pp_path,
+                                                  create_timeserie_monofield)
+from fre_pp_interface.writer import (output_filename, update_timeseries,
+                                     write_zarr)
+
+
+def find_cycles(ppdirs):
+    """ files of field tos in each cycle """
+    return [create_timeserie_monofield(create_pp_path(ppdir, 'ocean_monthly'),
+                                       'tos')
+            for ppdir in ppdirs]
+
+
+def update(ppdirs, outdir, gaps):
+    """ update files of 5 years in outdir, returns their names """
+    written = update_timeseries(find_cycles(ppdirs), str(outdir), 5,
+                                'ocean_monthly', 'tos', gaps=gaps)
+    return sorted(os.path.basename(f) for f in written)
+
+
+def output_files(outdir):
+    """ netcdf files in outdir """
+    return sorted(f for f in os.listdir(outdir) if f.endswith('.nc'))
+
+
+def test_update_timeseries(tmp_path):
+    ppdirs = make_pp_archive(str(tmp_path / 'archive'), ncycles=3,
+                             nyears=[12, 12, 11], slices=(1,))
+    outdir = tmp_path / 'out'
+    first = update(ppdirs, outdir, [0, 2])
+    assert first == output_files(outdir)
+    assert len(first) == 6
+
+    # nothing changed
+    assert update(ppdirs, outdir, [0, 2]) == []
+
+    # one more year in the last cycle: only its last window is rewritten,
+    # the file it replaces is removed
+    rep = create_pp_path(ppdirs[2], 'ocean_monthly')
+    write_pp_file(f"{rep}/1yr/{output_filename('ocean_monthly', 1969, 1969, 'tos')}",
+                  'tos', 1969, 1969, origin_year=1958)
+    written = update(ppdirs, outdir, [0, 2])
+    assert len(written) == 1
+    assert written[0] not in first
+    files = output_files(outdir)
+    assert len(files) == 6 and written[0] in files
+    assert len(set(first) - set(files)) == 1
+
+    # same as writing everything from scratch
+    reference = tmp_path / 'reference'
+    update(ppdirs, reference, [0, 2])
+    assert output_files(reference) == files
+    for f in files:
+        with xr.open_dataset(outdir / f, decode_times=False) as ds, \
+             xr.open_dataset(reference / f, decode_times=False) as ref:
+            xr.testing.assert_identical(ds.load(), ref.load())
+
+    # other gaps change offsets: everything is rewritten
+    written = update(ppdirs, outdir, [1, 2])
+    assert written == output_files(outdir)
+    assert len(written) == 6
+
+
+@pytest.mark.parametrize('calendar', ['noleap', 'julian'])
+def test_zarr_append_new_cycle(tmp_path, calendar):
+    pytest.importorskip('zarr')
+    ppdirs = make_pp_archive(str(tmp_path / 'archive'), ncycles=3,
+                             nyears=[5, 6, 4], slices=(1,),
+                             calendar=calendar)
+    list_of_cycles = find_cycles(ppdirs)
+    store = str(tmp_path / 'appended.zarr')
+    write_zarr(merge_cycles(list_of_cycles[:2], gaps=[1]), store,
+               chunks={'time': 12})
+    # the third cycle moves the origin of the merged time axis back
+    write_zarr(merge_cycles(list_of_cycles, gaps=[1, 2]), store,
+               append=True)
+    reference = str(tmp_path / 'reference.zarr')
+    write_zarr(merge_cycles(list_of_cycles, gaps=[1, 2]), reference,
+               chunks={'time': 12})
+
+    with xr.open_zarr(store, decode_times=False) as ds, \
+         xr.open_zarr(reference, decode_times=False) as ref:
+        assert ds['time'].attrs['units'] != ref['time'].attrs['units']
+        for var in ref.data_vars:
+            if var not in ['average_T1', 'average_T2', 'time_bnds']:
+                np.testing.assert_array_equal(ds[var].values,
+                                              ref[var].values)
+        # same dates counted in years from the origin of each time axis
+        for var in ['time', 'average_T1', 'average_T2', 'time_bnds']:
+            dates = [cftime.num2date(d[var].values.ravel(),
+                                     d['time'].attrs['units'],
+                                     calendar=calendar)
+                     for d in [ds, ref]]
+            origins = [origin_from_units(d['time'].attrs['units']).year
+                       for d in [ds, ref]]
+            assert ([(d.year - origins[0], d.month, d.day, d.hour)
+                     for d in dates[0]] ==
+                    [(d.year - origins[1], d.month, d.day, d.hour)
+                     for d in dates[1]])
+            if calendar == 'noleap':
+                np.testing.assert_array_equal(ds[var].values,
+                                              ref[var].values)